@@ -0,0 +1,243 @@
+# Scale microbenchmarks for utils/database: fills synthetic tables at several guild sizes
+# and times the storage functions, with the peak RSS seen during each one.
+#
+#   python benchmarks/db_scale.py --sizes 10000,100000,1000000
+#   python benchmarks/db_scale.py --sizes 10000 --repeat 200 --output results.json
+#
+# Every size runs in its own process so sizes don't share caches or memory high-water marks.
+# Results are written as JSON (default benchmarks/results/db_scale-<commit>.json).
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.event_flood import git_commit, percentile
+
+def configure_environment(workdir):
+    os.environ["db_path"] = os.path.join(workdir, "scale.db")
+    os.environ["userexport_path"] = os.path.join(workdir, "user_data.json")
+    os.environ["armory_path"] = os.path.join(workdir, "armory_items.json")
+    os.environ["bestiary_path"] = os.path.join(workdir, "bestiary.json")
+    os.environ["perks_path"] = os.path.join(workdir, "perks_info.json")
+    os.environ.setdefault("admin_roles", "1")
+    os.environ.setdefault("guild_id", "1")
+    os.environ.setdefault("log_level", "WARNING")
+
+def current_rss():
+    # Resident set size in bytes, from /proc where available
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        # ru_maxrss is the high-water mark, in KiB on Linux and bytes on macOS
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+class RssSampler:
+    # Polls the RSS from a thread while a benchmark runs and keeps the highest value
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.peak = current_rss()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+def write_datasets(size, rng):
+    # Seed files scaled with the guild: an item and an enemy per hundred users, plus a few perks
+    items = max(100, size // 100)
+    armory = {
+        f"item{i}": {
+            "price": rng.randint(1, 500), "item_description": f"Synthetic item {i}",
+            "category_tag": f"Category {i % 12}", "species_tag": "n/a", "item_icon": "",
+        }
+        for i in range(items)
+    }
+    bestiary = {
+        f"enemy{i}": {
+            "nmy_description": "", "drop_pool": json.dumps(rng.sample(list(armory), 5)), "element": "",
+            "special": "", "hp": 10, "attack": 2, "speed": 2, "rarity": str(i % 5), "encounter_rate": rng.random(),
+            "nmy_icon": "",
+        }
+        for i in range(items)
+    }
+    perks = {str(10 ** 17 + i): {"perk_name": f"<Perk {i}>", "bonus": str(10 * (i + 1))} for i in range(20)}
+    for path, data in ((os.environ["armory_path"], armory), (os.environ["bestiary_path"], bestiary),
+                       (os.environ["perks_path"], perks)):
+        with open(path, "w") as file:
+            json.dump(data, file)
+    return list(armory)
+
+async def fill_users(pool, size, item_names, items_per_user, large_inventory, rng):
+    # Users with a few items and a character each; user 0 hoards `large_inventory` different items
+    chunk = 50_000
+    for start in range(0, size, chunk):
+        users = range(start, min(size, start + chunk))
+        async with pool.transaction() as conn:
+            await conn.executemany(
+                "INSERT INTO user_data (user_id, crowns, inventory, characters) VALUES (?, ?, '[]', ?)",
+                [(str(user), rng.randint(0, 100_000),
+                  json.dumps([{"name": f"char{user}", "title": "Wanderer", "sheet_url": ""}])) for user in users],
+            )
+            await conn.executemany(
+                "INSERT OR IGNORE INTO inventory (user_id, item_name, quantity) VALUES (?, ?, ?)",
+                [(str(user), name, rng.randint(1, 5)) for user in users for name in rng.sample(item_names, items_per_user)],
+            )
+    hoard = [f"hoard{i}" for i in range(large_inventory)]
+    async with pool.transaction() as conn:
+        await conn.executemany(
+            "INSERT OR IGNORE INTO inventory (user_id, item_name, quantity) VALUES ('0', ?, 1)", [(name,) for name in hoard]
+        )
+
+async def measure(name, operation, repeat):
+    # Runs `operation(i)` `repeat` times, returns latency percentiles and the peak RSS meanwhile
+    latencies = []
+    with RssSampler() as rss:
+        started = time.perf_counter()
+        for i in range(repeat):
+            call_started = time.perf_counter()
+            await operation(i)
+            latencies.append(time.perf_counter() - call_started)
+        elapsed = time.perf_counter() - started
+    result = {
+        "calls": repeat,
+        "ops_per_sec": round(repeat / elapsed, 1) if elapsed else None,
+        "mean_ms": round(elapsed / repeat * 1000, 3),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "max_ms": round(max(latencies) * 1000, 3),
+        "peak_rss_mb": round(rss.peak / 2 ** 20, 1),
+    }
+    print(f"  {name:<36} {result['mean_ms']:>10} ms/call  p99 {result['p99_ms']:>9} ms  peak RSS {result['peak_rss_mb']} MB", flush=True)
+    return result
+
+async def run_size(size, args):
+    from utils import database
+    from utils.accrual import crown_buffer
+    from utils.db_pool import pool
+    from utils.leaderboard import leaderboard
+
+    rng = random.Random(args.seed)
+    users = [str(rng.randrange(size)) for _ in range(args.repeat)]
+    results = {}
+
+    print(f"{size} users", flush=True)
+    item_names = write_datasets(size, rng)
+    results["init_db (cold, seeds datasets)"] = await measure("init_db (cold, seeds datasets)", lambda i: database.init_db(), 1)
+
+    fill_started = time.perf_counter()
+    await fill_users(pool, size, item_names, args.items_per_user, args.large_inventory, rng)
+    fill_seconds = round(time.perf_counter() - fill_started, 2)
+
+    results["init_db (warm)"] = await measure("init_db (warm)", lambda i: database.init_db(), 3)
+    results["load_leaderboard"] = await measure("load_leaderboard", lambda i: database.load_leaderboard(), 1)
+    results["get_user_data"] = await measure("get_user_data", lambda i: database.get_user_data(users[i]), args.repeat)
+    results["get_user_data (large inventory)"] = await measure(
+        "get_user_data (large inventory)", lambda i: database.get_user_data("0"), max(1, args.repeat // 10))
+    results["get_leaderboard (in memory)"] = await measure(
+        "get_leaderboard (in memory)", lambda i: database.get_leaderboard(), args.repeat)
+
+    # The SQL path the leaderboard takes before it is loaded
+    leaderboard.ready = False
+    results["get_leaderboard (SQL)"] = await measure("get_leaderboard (SQL)", lambda i: database.get_leaderboard(), max(1, args.repeat // 10))
+    leaderboard.ready = True
+
+    results["give_crowns"] = await measure(
+        "give_crowns", lambda i: database.give_crowns(users[i], 1, users[-1 - i]), args.repeat)
+    results["manage_inventory (large inventory)"] = await measure(
+        "manage_inventory (large inventory)", lambda i: database.manage_inventory("0", f"hoard{i % max(1, args.large_inventory)}", 1 - 2 * (i % 2)), args.repeat)
+    results["manage_user_characters"] = await measure(
+        "manage_user_characters", lambda i: database.manage_user_characters(
+            users[i], f"extra{i}", "Bench", "", "add" if i % 2 == 0 else "remove"), args.repeat)
+    await crown_buffer.flush()
+
+    results["export_user_data (full)"] = await measure("export_user_data (full)", lambda i: database.export_user_data(), 1)
+    results["export_user_data (incremental)"] = await measure(
+        "export_user_data (incremental)", lambda i: database.export_user_data(incremental=True), 1)
+    results["import_user_data"] = await measure(
+        "import_user_data", lambda i: database.import_user_data(database.full_export_path), 1)
+
+    db_size = os.path.getsize(os.environ["db_path"])
+    await pool.close()
+    return {"users": size, "fill_seconds": fill_seconds, "db_size_mb": round(db_size / 2 ** 20, 1), "functions": results}
+
+def worker(args):
+    # One size, in this process, printing the result as the last line of stdout
+    with tempfile.TemporaryDirectory(prefix="faded-scale-") as workdir:
+        configure_environment(workdir)
+        result = asyncio.run(run_size(args.size, args))
+    print(json.dumps(result))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Time utils/database functions at several guild sizes.")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="comma-separated user counts")
+    parser.add_argument("--repeat", type=int, default=500, help="calls per point-lookup benchmark")
+    parser.add_argument("--items-per-user", type=int, default=3)
+    parser.add_argument("--large-inventory", type=int, default=5000, help="distinct items held by the hoarding user")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="where to write the JSON results")
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+def main(args):
+    results = []
+    for size in (int(size) for size in args.sizes.split(",")):
+        command = [sys.executable, os.path.abspath(__file__), "--worker", "--size", str(size),
+                   "--repeat", str(args.repeat), "--items-per-user", str(args.items_per_user),
+                   "--large-inventory", str(args.large_inventory), "--seed", str(args.seed)]
+        process = subprocess.run(command, stdout=subprocess.PIPE, text=True)
+        lines = process.stdout.strip().splitlines()
+        print("\n".join(lines[:-1]))
+        if process.returncode != 0 or not lines:
+            results.append({"users": size, "error": f"worker exited with {process.returncode}"})
+            continue
+        results.append(json.loads(lines[-1]))
+
+    commit = git_commit()
+    output = args.output or os.path.join(ROOT, "benchmarks", "results", f"db_scale-{commit or 'local'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    report = {
+        "benchmark": "db_scale",
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": vars(args),
+        "results": results,
+    }
+    with open(output, "w") as file:
+        json.dump(report, file, indent=4)
+    print(f"Results written to {output}")
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    if arguments.worker:
+        worker(arguments)
+    else:
+        main(arguments)
@@ -0,0 +1,271 @@
+# Synthetic gateway event flood: drives the bot's handlers with fake discord objects
+# against a throwaway SQLite file and reports throughput, latency and event-loop lag.
+#
+#   python benchmarks/event_flood.py --scenario all --events 5000 --concurrency 50
+#   python benchmarks/event_flood.py --scenario on_message --rate 2000 --output results.json
+#
+# Results are written as JSON (default benchmarks/results/event_flood-<commit>.json)
+# so runs on different commits can be compared.
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fakes import FakeChannel, FakeContext, FakeGuild, FakeMember, FakeMessage, FakeRole
+
+SCENARIOS = ("on_message", "update_crowns", "give", "purchase", "perks")
+GUILD_ID = 1
+
+def configure_environment(workdir):
+    # Point the bot at a temp database and the bundled data files, before anything reads the env.
+    # load_dotenv never overrides variables that are already set, so a local .env can't leak in.
+    os.environ["db_path"] = os.path.join(workdir, "bench.db")
+    os.environ["userexport_path"] = os.path.join(workdir, "user_data.json")
+    os.environ["armory_path"] = os.path.join(ROOT, "data", "armory_items.json")
+    os.environ["bestiary_path"] = os.path.join(ROOT, "data", "bestiary.json")
+    os.environ["perks_path"] = os.path.join(ROOT, "data", "perks_info.json")
+    os.environ["guild_id"] = str(GUILD_ID)
+    os.environ.setdefault("admin_roles", "1")
+    os.environ.setdefault("prefix", "!")
+    os.environ.setdefault("token", "benchmark")
+    os.environ.pop("metrics_port", None)
+    # Keep log output from skewing the numbers
+    os.environ.setdefault("log_level", "WARNING")
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, round(fraction * (len(ordered) - 1)))]
+
+def summarise(samples):
+    return {
+        "p50_ms": round(percentile(samples, 0.5) * 1000, 3),
+        "p99_ms": round(percentile(samples, 0.99) * 1000, 3),
+        "max_ms": round(max(samples, default=0.0) * 1000, 3),
+    }
+
+class LagProbe:
+    # Records how late a short sleep wakes up, i.e. how long the loop was busy elsewhere
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = []
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - started - self.interval))
+
+async def run_scenario(handler, events, rate, concurrency):
+    # `concurrency` workers take events in order; with a rate, each event waits for its slot
+    latencies = []
+    errors = []
+    next_event = iter(range(events))
+    probe = LagProbe()
+    probe.start()
+    started = time.perf_counter()
+
+    async def worker():
+        for index in next_event:
+            if rate:
+                delay = started + index / rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            event_started = time.perf_counter()
+            try:
+                await handler(index)
+            except Exception as e:
+                errors.append(repr(e))
+            latencies.append(time.perf_counter() - event_started)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    await probe.stop()
+    return {
+        "events": events,
+        "seconds": round(elapsed, 4),
+        "events_per_sec": round(events / elapsed, 1) if elapsed else None,
+        "latency": summarise(latencies),
+        "loop_lag": summarise(probe.samples),
+        "errors": len(errors),
+        "first_errors": errors[:5],
+    }
+
+class Harness:
+    def __init__(self, args):
+        self.args = args
+        self.random = random.Random(args.seed)
+
+    async def setup(self):
+        # Imported here so the environment is configured first
+        import bot as bot_module
+        from utils import database
+        from utils.accrual import crown_buffer
+        from utils.db_pool import pool
+
+        self.bot_module = bot_module
+        self.database = database
+        self.crown_buffer = crown_buffer
+        self.pool = pool
+        bot = self.bot = bot_module.bot
+
+        await database.create_schema()
+        await database.seed_data()
+
+        # A guild of fake members, every one of them with a funded profile
+        self.guild = FakeGuild(GUILD_ID)
+        self.members = [self.guild.add_member(FakeMember()) for _ in range(self.args.users)]
+        self.channel = FakeChannel()
+        async with pool.transaction() as conn:
+            await conn.executemany(
+                "INSERT INTO user_data (user_id, crowns, inventory) VALUES (?, ?, '[]')",
+                [(str(member.id), self.args.starting_crowns) for member in self.members],
+            )
+        await database.load_leaderboard()
+        await database.load_armory_index()
+
+        # Every perk role goes to a share of the guild
+        for perk_id, perk_name, _ in await database.get_perks():
+            holders = self.random.sample(self.members, max(1, len(self.members) // 4))
+            self.guild.add_role(FakeRole(perk_id, perk_name, holders))
+
+        # Offline stand-ins for what the gateway would provide
+        bot.get_guild = lambda guild_id: self.guild if guild_id == GUILD_ID else None
+        bot._connection.user = FakeMember(bot=True)
+
+        for cog in ("cogs.user", "cogs.store", "cogs.perk"):
+            await bot.load_extension(cog)
+        # The weekly payout waits for a gateway connection that never comes, the benchmark pays on demand
+        bot.get_cog("Perk").weekly_perk_task.cancel()
+        self.items = [(name, price) for name, price, *_ in await database.get_catalogue_items()]
+
+    async def teardown(self):
+        for cog in list(self.bot.cogs):
+            await self.bot.remove_cog(cog)
+        await self.crown_buffer.stop()
+        await self.pool.close()
+
+    def member(self):
+        return self.random.choice(self.members)
+
+    async def on_message(self, index):
+        content = "x" * self.random.randint(1, 400)
+        message = FakeMessage(self.member(), content, self.channel, self.guild, state=self.bot._connection)
+        await self.bot_module.on_message(message)
+
+    async def update_crowns(self, index):
+        member = self.member()
+        await self.database.update_crowns(member.id, self.random.randint(1, 50), member)
+
+    async def give(self, index):
+        giver, *recipients = self.random.sample(self.members, self.random.randint(2, 4))
+        cog = self.bot.get_cog("User")
+        ctx = FakeContext(self.bot, giver, self.channel, self.guild, cog.give)
+        await cog.give(ctx, 1, recipients)
+
+    async def purchase(self, index):
+        item_name, price = self.random.choice(self.items)
+        await self.bot.get_cog("Store").purchase_item(self.member(), item_name, price)
+
+    async def perks(self, index):
+        await self.bot.get_cog("Perk").assign_crowns_for_perks()
+
+    async def run(self, scenario):
+        handler = getattr(self, scenario)
+        # A whole-guild payout is one event, so it gets its own (small) count and no parallelism
+        events = self.args.perk_rounds if scenario == "perks" else self.args.events
+        concurrency = 1 if scenario == "perks" else self.args.concurrency
+        result = await run_scenario(handler, events, self.args.rate, concurrency)
+
+        # Buffered Crowns count towards the scenario's cost
+        flush_started = time.perf_counter()
+        await self.crown_buffer.flush()
+        result["final_flush_ms"] = round((time.perf_counter() - flush_started) * 1000, 3)
+        result["concurrency"] = concurrency
+        if scenario == "on_message":
+            from utils.earning import earning_limiter
+            result["earning"] = earning_limiter.stats()
+        return result
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def main(args):
+    harness = Harness(args)
+    await harness.setup()
+    try:
+        scenarios = SCENARIOS if args.scenario == "all" else (args.scenario,)
+        results = {}
+        for scenario in scenarios:
+            results[scenario] = await harness.run(scenario)
+            result = results[scenario]
+            print(
+                f"{scenario:>14}: {result['events_per_sec']:>9} events/s  "
+                f"p50 {result['latency']['p50_ms']} ms  p99 {result['latency']['p99_ms']} ms  "
+                f"loop lag p99 {result['loop_lag']['p99_ms']} ms  errors {result['errors']}"
+            )
+    finally:
+        await harness.teardown()
+    return results
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Flood the bot's handlers with synthetic gateway events.")
+    parser.add_argument("--scenario", choices=("all",) + SCENARIOS, default="all")
+    parser.add_argument("--events", type=int, default=5000, help="events per scenario")
+    parser.add_argument("--rate", type=float, default=0, help="events per second, 0 for as fast as possible")
+    parser.add_argument("--concurrency", type=int, default=50, help="events in flight at once")
+    parser.add_argument("--users", type=int, default=2000, help="fake guild members")
+    parser.add_argument("--starting-crowns", type=int, default=1_000_000)
+    parser.add_argument("--perk-rounds", type=int, default=5, help="whole-guild perk payouts")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="where to write the JSON results")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    with tempfile.TemporaryDirectory(prefix="faded-bench-") as workdir:
+        configure_environment(workdir)
+        results = asyncio.run(main(args))
+
+    commit = git_commit()
+    output = args.output or os.path.join(ROOT, "benchmarks", "results", f"event_flood-{commit or 'local'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    report = {
+        "benchmark": "event_flood",
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": vars(args),
+        "results": results,
+    }
+    with open(output, "w") as file:
+        json.dump(report, file, indent=4)
+    print(f"Results written to {output}")
@@ -0,0 +1,95 @@
+# Minimal stand-ins for the discord objects the bot touches, so handlers can run without a gateway.
+# They only carry the attributes the cogs and bot.py actually read.
+import itertools
+
+ids = itertools.count(10 ** 17)
+
+class FakeRole:
+    def __init__(self, role_id, name, members=None):
+        self.id = role_id
+        self.name = name
+        self.members = members if members is not None else []
+
+    @property
+    def mention(self):
+        return f"<@&{self.id}>"
+
+class FakeMember:
+    def __init__(self, member_id=None, guild=None, roles=None, bot=False):
+        self.id = member_id if member_id is not None else next(ids)
+        self.name = f"user{self.id}"
+        self.display_name = self.name
+        self.guild = guild
+        self.roles = roles if roles is not None else []
+        self.bot = bot
+
+    @property
+    def mention(self):
+        return f"<@{self.id}>"
+
+class FakeGuild:
+    def __init__(self, guild_id):
+        self.id = guild_id
+        self.name = f"guild{guild_id}"
+        self._members = {}
+        self._roles = {}
+
+    @property
+    def members(self):
+        return list(self._members.values())
+
+    @property
+    def roles(self):
+        return list(self._roles.values())
+
+    def add_member(self, member):
+        member.guild = self
+        self._members[member.id] = member
+        return member
+
+    def add_role(self, role):
+        self._roles[role.id] = role
+        for member in role.members:
+            member.roles.append(role)
+        return role
+
+    def get_member(self, member_id):
+        return self._members.get(member_id)
+
+    def get_role(self, role_id):
+        return self._roles.get(role_id)
+
+class FakeChannel:
+    # Counts what the bot would have sent instead of sending it
+    def __init__(self):
+        self.id = next(ids)
+        self.sent = 0
+
+    async def send(self, content=None, **kwargs):
+        self.sent += 1
+
+class FakeMessage:
+    def __init__(self, author, content, channel, guild, state=None):
+        self.id = next(ids)
+        self.author = author
+        self.content = content
+        self.channel = channel
+        self.guild = guild
+        self.mentions = []
+        self.attachments = []
+        # discord.py's Context reads the connection state from the message
+        self._state = state
+
+class FakeContext:
+    # Enough of commands.Context to call a command's callback directly
+    def __init__(self, bot, author, channel, guild, command=None):
+        self.bot = bot
+        self.author = author
+        self.channel = channel
+        self.guild = guild
+        self.command = command
+        self.command_failed = False
+        self.message = FakeMessage(author, "", channel, guild)
+
+    async def send(self, content=None, **kwargs):
+        await self.channel.send(content, **kwargs)
@@ -1,39 +1,128 @@
+import time
+started = time.perf_counter()
+
 import discord
 from discord.ext import commands
 import os
 from dotenv import load_dotenv
-from utils.database import init_db, add_user, update_crowns
+from utils.database import create_schema, seed_data, load_leaderboard, load_armory_index, load_bestiary_index, add_user
+from utils.accrual import crown_buffer
+from utils.earning import earning_limiter
+from utils.leaderboard import leaderboard
+from utils.db_pool import pool
+from utils.watchdog import watchdog
+from utils.log import setup_logging, get_logger
+from utils.metrics import metrics
+from utils.metrics_http import metrics_server
+imported = time.perf_counter()
 
 # Load .env file to get variables
 load_dotenv()
 token = os.getenv("token")
 prefix = os.getenv("prefix")
+env_loaded = time.perf_counter()
+
+# Logging goes through a queue so nothing on the event loop waits on stdout
+setup_logging()
+log = get_logger("bot")
+
+class FadedBot(commands.Bot):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.startup_timings = [("imports", imported - started), ("dotenv/env parsing", env_loaded - imported)]
+        self.setup_finished = None
+
+    def record_timing(self, phase, since):
+        elapsed = time.perf_counter() - since
+        self.startup_timings.append((phase, elapsed))
+        log.info(f"[startup] {phase}: {elapsed * 1000:.1f} ms", extra={"phase": phase, "ms": round(elapsed * 1000, 1)})
+
+    # Runs once before connecting to the gateway, reconnects don't repeat it
+    async def setup_hook(self):
+        for phase, elapsed in self.startup_timings:
+            log.info(f"[startup] {phase}: {elapsed * 1000:.1f} ms", extra={"phase": phase, "ms": round(elapsed * 1000, 1)})
+
+        watchdog.start()  # Start measuring event-loop lag
+
+        phase_start = time.perf_counter()
+        await create_schema()  # Initialize the database before any command can run
+        self.record_timing("database schema", phase_start)
+
+        phase_start = time.perf_counter()
+        await seed_data()
+        self.record_timing("data seeding", phase_start)
+
+        phase_start = time.perf_counter()
+        await load_leaderboard()
+        self.record_timing("leaderboard", phase_start)
+
+        phase_start = time.perf_counter()
+        await load_armory_index()
+        self.record_timing("armory index", phase_start)
+
+        phase_start = time.perf_counter()
+        await load_bestiary_index()
+        self.record_timing("bestiary index", phase_start)
+
+        # Automatically load cogs from the "cogs" folder
+        for filename in sorted(os.listdir("./cogs")):
+            if filename.endswith(".py") and not filename.startswith("_"):
+                cog_name = f"cogs.{filename[:-3]}"
+                phase_start = time.perf_counter()
+                try:
+                    await self.load_extension(cog_name)
+                    self.record_timing(f"cog {cog_name}", phase_start)
+                except Exception as e:
+                    log.exception(f"Failed to load cog {cog_name}: {e}")
+
+        phase_start = time.perf_counter()
+        await metrics_server.start(self)  # Only listens when metrics_port is set
+        self.record_timing("metrics endpoint", phase_start)
+
+        self.setup_finished = time.perf_counter()
+
+    # Write buffered message Crowns before shutting down so a clean restart loses nothing
+    async def close(self):
+        watchdog.stop()
+        await metrics_server.stop()
+        try:
+            await crown_buffer.stop()
+        except Exception as e:
+            log.exception(f"Failed to flush message Crowns on shutdown: {e}")
+        await super().close()
+        await pool.close()
 
 # Set up the bot's prefix and intents, disable default help command
-bot = commands.Bot(command_prefix=prefix, help_command=None, intents=discord.Intents.all())
+bot = FadedBot(command_prefix=prefix, help_command=None, intents=discord.Intents.all())
+# Time every command, including those of cogs added later
+@bot.before_invoke
+async def before_command(ctx):
+    watchdog.command_started(ctx)
+    await metrics.command_started(ctx)
 
-# Event that runs when the bot starts
+# Runs after every invoked command, failed ones included
+@bot.after_invoke
+async def after_command(ctx):
+    watchdog.command_finished(ctx)
+    await metrics.command_finished(ctx)
+
+# Event that runs whenever the bot (re)connects
 @bot.event
 async def on_ready():
-    print(f'Logged in as {bot.user}')
-    init_db()  # Initialize the database when the bot starts
-
-    # Automatically load cogs from the "cogs" folder
-    for filename in os.listdir("./cogs"):
-        if filename.endswith(".py") and not filename.startswith("_"):
-            cog_name = f"cogs.{filename[:-3]}"
-            try:
-                await bot.load_extension(cog_name)
-                print(f"Loaded cog: {cog_name}")
-            except Exception as e:
-                print(f"Failed to load cog {cog_name}: {e}")
+    log.info(f'Logged in as {bot.user}')
+    # Only the first READY counts towards the cold start
+    if bot.setup_finished is not None:
+        bot.record_timing("gateway connect", bot.setup_finished)
+        bot.setup_finished = None
+        total = time.perf_counter() - started
+        log.info(f"[startup] total: {total * 1000:.1f} ms", extra={"phase": "total", "ms": round(total * 1000, 1)})
                 
 # Adds new users to the database
 @bot.event
 async def on_member_join(member):
     user_id = str(member.id)
-    add_user(user_id)
-    print(f"Added {member.name} to the database.")
+    await add_user(user_id)
+    log.info(f"Added {member.name} to the database.", extra={"user_id": user_id})
 
 # Track Crowns when a user sends a message
 @bot.event
@@ -42,15 +131,16 @@ async def on_message(message):
         return  # Ignore bot messages
 
     user_id = str(message.author.id)
-    # Get name for more legible logs
-    name = message.author
 
-    # Calculate Crowns based on message length
-    Gains = round(len(message.content)/10)
-    # Update user Crowns
-    await update_crowns(user_id, Gains, name)
+    # Calculate Crowns based on message length, limited by the user's earning budget
+    Gains = earning_limiter.allow(user_id, round(len(message.content)/10))
+    # Buffer the Crowns, they are written to the database in batches.
+    # Throttled messages are only buffered to create the profile of users we haven't seen.
+    if Gains or user_id not in leaderboard.balances:
+        crown_buffer.add(user_id, Gains)
     await bot.process_commands(message)  # Ensure commands still work
 
-# Run the bot with token
-bot.run(token)
-
+# Run the bot with token when started as a script, importing it (e.g. from the benchmarks) only sets it up
+if __name__ == "__main__":
+    # discord.py's own logs go through the same pipeline, so it must not install its handler
+    bot.run(token, log_handler=None)
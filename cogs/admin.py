@@ -1,19 +1,54 @@
 from discord.ext import commands
+import csv
+import io
 import os
 import sqlite3
+import typing
 import discord
 from dotenv import load_dotenv
-from utils.database import manage_inventory, is_admin, embed_builder, export_users_to_json
+from utils.database import manage_inventory, is_admin, is_admin_member, embed_builder, export_user_data, adjust_crowns, add_perk, remove_perk, split_crowns, seed_dataset, DATASETS, bulk_adjust, expand_targets
+from utils.watchdog import watchdog
+from utils.identity import resolver
+from utils.earning import earning_limiter
+from utils.log import get_logger
 
 # Load .env file to get variables
 load_dotenv()
-db_path = os.getenv("db_path")
-export_path = os.getenv("userexport_path")
 guild_id = os.getenv("guild_id")
 
+log = get_logger("admin")
+
+# Largest CSV accepted by !admin bulkcsv
+max_csv_bytes = 1024 * 1024
+
+def parse_bulk_csv(text):
+    # Rows of user_id,crowns,item_name,quantity (with that header, crowns and item columns optional).
+    # Returns the operations for bulk_adjust and the (line, reason) of rows that were skipped.
+    operations, skipped = [], []
+    for row in csv.DictReader(io.StringIO(text)):
+        line = row.get("user_id") or "?"
+        try:
+            user_id = int(row["user_id"].strip().strip("<@!>"))
+            crowns = int(row.get("crowns") or 0)
+            item_name = (row.get("item_name") or "").strip() or None
+            quantity = int(row.get("quantity") or 0) if item_name else 0
+        except (KeyError, AttributeError, ValueError):
+            skipped.append((line, "unreadable row"))
+            continue
+        if not crowns and not quantity:
+            skipped.append((line, "nothing to change"))
+            continue
+        operations.append((user_id, crowns, item_name, quantity))
+    return operations, skipped
+
 class Admin(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+
+    # Checks on the admin group don't run for its subcommands (invoke_without_command),
+    # so every command of this cog is gated here
+    async def cog_check(self, ctx):
+        return await is_admin_member(ctx)
     
     
     @commands.group(name="admin", invoke_without_command=True, hidden=False)
@@ -52,19 +87,27 @@ class Admin(commands.Cog):
     # ADD OR REMOVE ITEMS
     @admin_group.command(name="items", help="Add or remove items from user inventories.\n Syntax: !admin items <user> <item_name> <+-quantity>")
     async def manage_items(self, ctx, member: commands.MemberConverter, item_name: str, quantity: int):
-        manage_inventory(member.id, item_name, quantity)
+        remaining = await manage_inventory(member.id, item_name, quantity)
         if quantity>0:
-            await ctx.send(f"{quantity} {item_name} has been added to {member.display_name}'s inventory.")
+            await ctx.send(f"{quantity} {item_name} has been added to {member.display_name}'s inventory. They now have {remaining}.")
         else:
-            await ctx.send(f"{-quantity} {item_name} has been removed from {member.display_name}'s inventory.")
+            await ctx.send(f"{-quantity} {item_name} has been removed from {member.display_name}'s inventory. They now have {remaining}.")
     
-    @admin_group.command(name="print", help="Prints current user database to json.\n Used for backing up data and updating the bot.")
-    async def export_users(self, ctx):
-        #Export the user_data table to a JSON file.
+    @admin_group.command(name="print", help="Exports the user database to a compressed NDJSON file.\n Used for backing up data and updating the bot.\n Syntax: !admin print [full|incremental]")
+    async def export_users(self, ctx, mode: str = "full"):
+        #Export the user_data table, only users changed since the last export in incremental mode.
+        if mode.lower() not in ("full", "incremental"):
+            await ctx.send("Invalid mode. Use `full` or `incremental`.")
+            return
+
         try:
-            export_users_to_json()  # Call the function to export data
-            await ctx.send(file=discord.File(export_path))
-            await ctx.send(f"User data exported successfully to `{export_path}`.")      
+            path, count = await export_user_data(incremental=mode.lower() == "incremental")  # Call the function to export data
+            limit = ctx.guild.filesize_limit if ctx.guild else 8 * 1024 * 1024
+            if os.path.getsize(path) <= limit:
+                await ctx.send(file=discord.File(path))
+            else:
+                await ctx.send("The export is too large to upload here, it is only kept on the server.")
+            await ctx.send(f"Exported {count} users successfully to `{path}`.")      
         except Exception as e:
             await ctx.send(f"An error occurred: {e}")
 
@@ -72,42 +115,51 @@ class Admin(commands.Cog):
     async def manage_money(self, ctx, member: commands.MemberConverter, amount: int):
        
         try:
-            with sqlite3.connect(db_path) as conn:
-                cursor = conn.cursor()
-                
-                # Check if user exists in the database
-                cursor.execute("SELECT crowns FROM user_data WHERE user_id = ?", (str(member.id),))
-                result = cursor.fetchone()
-
-                if result:
-                    current_crowns = result[0]
-
-                    if current_crowns + amount < 0:
-                        print(f"{member.display_name} does not have enough on balance to remove {abs(amount)} Crowns.")
-                        await ctx.send(f"{member.display_name} does not have enough on balance to remove {abs(amount)} Crowns.")
-                        return
-
-                    # Update the user's Crown balance
-                    print(f"Updating Crowns for user {member.display_name}. Adding {(amount)} Crowns.")
-                    cursor.execute("UPDATE user_data SET crowns = crowns + ? WHERE user_id = ?",(amount, str(member.id)),)
-                    new_balance = result[0] + amount
-                    conn.commit()
-                else:    
-                    await ctx.send(f"{member.display_name} does not have a profile in the database.")
-                    return
-                
+            # Update the user's Crown balance
+            new_balance = await adjust_crowns(member.id, amount)
+
+            if new_balance is None:
+                await ctx.send(f"{member.display_name} does not have a profile in the database.")
+                return
+
+            if new_balance is False:
+                log.info(f"{member.display_name} does not have enough on balance to remove {abs(amount)} Crowns.")
+                await ctx.send(f"{member.display_name} does not have enough on balance to remove {abs(amount)} Crowns.")
+                return
+
+            log.info(f"Updated Crowns for user {member.display_name}. Added {(amount)} Crowns.", extra={"user_id": str(member.id), "crowns": amount})
+
             operation1 = "added" if amount > 0 else "removed"
             operation2 = "to" if amount > 0 else "from"
             await ctx.send(f"Successfully {operation1} {abs(amount)} Crowns {operation2} {member.mention}'s account. They now have {new_balance} Crowns.")
         except sqlite3.Error as e:
             await ctx.send(f"Failed to manage Crowns due to a database error: {e}")
 
+    @admin_group.command(name="splitpot", help = "Splits a pot of Crowns evenly between everyone with a role.\n Syntax: !admin splitpot <amount> <role>")
+    async def split_pot(self, ctx, amount: int, role: discord.Role):
+        if amount <= 0:
+            await ctx.send("The pot has to be a positive amount.")
+            return
+
+        members = [member for member in role.members if not member.bot]
+        if not members:
+            await ctx.send(f"Nobody has the role **{role.name}**.")
+            return
+
+        try:
+            share = await split_crowns(amount, [member.id for member in members])
+        except sqlite3.Error as e:
+            await ctx.send(f"Failed to split the pot due to a database error: {e}")
+            return
+
+        if share == 0:
+            await ctx.send(f"{amount} Crowns is not enough to give each of the {len(members)} members of **{role.name}** at least one Crown.")
+            return
+        log.info(f"Split {amount} Crowns between {len(members)} members of {role.name}, {share} Crowns each.")
+        await ctx.send(f"Split the pot between {len(members)} members of **{role.name}**: {share} Crowns each.")
+
     @admin_group.command(name="perk", help = "Adds or removes a perk and their corresponding daily payouts.\n Syntax: !admin perk add <role_id> <bonus> || !admin perk remove <role_id>")
     async def manage_perk(self, ctx, action: str, role_id: int, bonus: int = 0):
-        # Connect to the database
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-
         try:
             guild = self.bot.get_guild(ctx.guild.id)
             role = guild.get_role(role_id)
@@ -118,29 +170,149 @@ class Admin(commands.Cog):
 
             if action.lower() == "add":
                 # Add the perk to the database
-                cursor.execute(
-                    "INSERT OR IGNORE INTO perks_data (id, perk_name, bonus) VALUES (?, ?, ?)",
-                    (role_id, role.name, bonus),
-                )
-                conn.commit()
+                await add_perk(role_id, role.name, bonus)
                 await ctx.send(f"Added perk: **{role.name}** with a bonus of **{bonus} Crowns** to the database.")
-                print (f"Added perk: {role.name} with a bonus of {bonus} Crowns to the database.")
+                log.info(f"Added perk: {role.name} with a bonus of {bonus} Crowns to the database.", extra={"role_id": role_id, "bonus": bonus})
 
             elif action.lower() == "remove":
                 # Remove the perk from the database
-                cursor.execute("DELETE FROM perks_data WHERE id = ?", (role_id,))
-                conn.commit()
+                await remove_perk(role_id)
                 await ctx.send(f"Removed perk: **{role.name}** from the database.")
-                print (f"Removed perk: {role.name} from the database.")
+                log.info(f"Removed perk: {role.name} from the database.", extra={"role_id": role_id})
 
             else:
                 await ctx.send("Invalid action. Use `add` to add a perk or `remove` to remove a perk.")
 
         except Exception as e:
             await ctx.send(f"An error occurred: {e}")
-        finally:
-            conn.close()
     
+    # BULK ECONOMY OPERATIONS, all targets are handled in one transaction
+    async def send_bulk_summary(self, ctx, change, summary, skipped=()):
+        def names(user_ids):
+            shown = []
+            for user_id in user_ids[:15]:
+                member = ctx.guild.get_member(int(user_id)) if ctx.guild and str(user_id).isdigit() else None
+                shown.append(member.display_name if member else str(user_id))
+            more = f" and {len(user_ids) - 15} more" if len(user_ids) > 15 else ""
+            return ", ".join(shown) + more if shown else "None"
+
+        skipped = list(skipped) + summary["skipped"]
+        embed = embed_builder(
+            title="Bulk update",
+            description=f"{change}: applied to {len(summary['applied'])}, skipped {len(skipped)}, insufficient balance {len(summary['insufficient'])}.",
+            fields={
+                "Skipped": names([f"{user_id} ({reason})" for user_id, reason in skipped]),
+                "Insufficient balance": names(summary["insufficient"]),
+            },
+        )
+        log.info(
+            f"Bulk update ({change}): {len(summary['applied'])} applied, {len(skipped)} skipped, {len(summary['insufficient'])} insufficient.",
+            extra={"applied": len(summary["applied"]), "skipped": len(skipped), "insufficient": len(summary["insufficient"])},
+        )
+        await ctx.send(embed=embed)
+
+    @admin_group.command(name="bulkmoney", help="Adds or removes Crowns for everyone with the given roles and every mentioned user, in one go.\n Syntax: !admin bulkmoney <+-amount> <@role|@user> [@role|@user ...]")
+    async def bulk_money(self, ctx, amount: int, targets: commands.Greedy[typing.Union[discord.Member, discord.Role]]):
+        members = expand_targets(targets)
+        if not amount or not members:
+            await ctx.send("Please give a non-zero amount and mention at least one role or user.")
+            return
+        try:
+            summary = await bulk_adjust([(member.id, amount, None, 0) for member in members])
+        except sqlite3.Error as e:
+            await ctx.send(f"Failed to manage Crowns due to a database error: {e}")
+            return
+        await self.send_bulk_summary(ctx, f"{amount:+} Crowns", summary)
+
+    @admin_group.command(name="bulkitems", help="Adds or removes an item for everyone with the given roles and every mentioned user, in one go.\n Syntax: !admin bulkitems <item_name> <+-quantity> <@role|@user> [@role|@user ...]")
+    async def bulk_items(self, ctx, item_name: str, quantity: int, targets: commands.Greedy[typing.Union[discord.Member, discord.Role]]):
+        members = expand_targets(targets)
+        if not quantity or not members:
+            await ctx.send("Please give a non-zero quantity and mention at least one role or user.")
+            return
+        try:
+            summary = await bulk_adjust([(member.id, 0, item_name, quantity) for member in members])
+        except sqlite3.Error as e:
+            await ctx.send(f"Failed to manage items due to a database error: {e}")
+            return
+        await self.send_bulk_summary(ctx, f"{quantity:+} {item_name}", summary)
+
+    @admin_group.command(name="bulkcsv", help="Applies the Crowns and items listed in an attached CSV, in one go.\n Columns: user_id,crowns,item_name,quantity\n Syntax: !admin bulkcsv (with the file attached)")
+    async def bulk_csv(self, ctx):
+        attachment = ctx.message.attachments[0] if ctx.message.attachments else None
+        if attachment is None or not attachment.filename.lower().endswith(".csv"):
+            await ctx.send("Please attach a CSV file with the columns user_id,crowns,item_name,quantity.")
+            return
+        if attachment.size > max_csv_bytes:
+            await ctx.send("The CSV is too large, please split it up.")
+            return
+
+        try:
+            operations, skipped = parse_bulk_csv((await attachment.read()).decode("utf-8-sig"))
+        except UnicodeDecodeError:
+            await ctx.send("The CSV could not be read, please save it as UTF-8.")
+            return
+        if not operations:
+            await ctx.send("The CSV has no rows to apply.")
+            return
+
+        try:
+            summary = await bulk_adjust(operations)
+        except sqlite3.Error as e:
+            await ctx.send(f"Failed to apply the CSV due to a database error: {e}")
+            return
+        await self.send_bulk_summary(ctx, f"{attachment.filename} ({len(operations)} rows)", summary, skipped)
+
+    @admin_group.command(name="reload", help="Re-reads a data file and applies only what changed.\n Syntax: !admin reload <armory|bestiary|perks>")
+    async def reload_dataset(self, ctx, dataset: str):
+        dataset = dataset.lower()
+        if dataset not in DATASETS:
+            await ctx.send(f"Unknown dataset. Use one of: {', '.join(DATASETS)}.")
+            return
+
+        try:
+            result = await seed_dataset(dataset)
+        except Exception as e:
+            await ctx.send(f"An error occurred: {e}")
+            return
+
+        if result is None:
+            await ctx.send(f"The {dataset} data has not changed since it was last loaded.")
+        else:
+            added, changed, removed = result
+            await ctx.send(f"Reloaded {dataset}: {added} added, {changed} changed, {removed} removed.")
+
+    @admin_group.command(name="caches", help="Shows hit and miss counters of the bot's caches.")
+    async def show_caches(self, ctx):
+        stats = resolver.stats()
+        await ctx.send(
+            f"**User lookups**: {stats['member_cache_hits']} member cache hits, {stats['lru_hits']} LRU hits, "
+            f"{stats['coalesced']} coalesced, {stats['rest_fetches']} REST fetches "
+            f"({stats['hit_rate']:.0%} hit rate, {stats['cached_users']} users cached)"
+        )
+
+        stats = earning_limiter.stats()
+        await ctx.send(
+            f"**Message Crowns**: {stats['allowed']} paid in full, {stats['clamped']} clamped, "
+            f"{stats['dropped']} dropped ({stats['crowns_suppressed']} Crowns withheld, {stats['tracked_users']} users tracked)"
+        )
+
+        store_cog = self.bot.get_cog("Store")
+        if store_cog:
+            stats = store_cog.page_cache.stats()
+            await ctx.send(
+                f"**Store pages**: {stats['hits']} hits, {stats['misses']} misses "
+                f"({stats['hit_rate']:.0%} hit rate, {stats['cached_pages']} pages cached, "
+                f"{len(store_cog.sessions)} shoppers browsing)"
+            )
+
+    @admin_group.command(name="lag", help="Shows event-loop lag overall and per command.")
+    async def show_lag(self, ctx):
+        lines = [f"Stalls over {watchdog.threshold * 1000:.0f} ms: {watchdog.stalls}"]
+        for name, samples, p50, p99, worst in watchdog.summary()[:15]:
+            lines.append(f"**{name}**: {samples} samples, p50 {p50 * 1000:.1f} ms, p99 {p99 * 1000:.1f} ms, worst {worst * 1000:.1f} ms")
+        await ctx.send("\n".join(lines))
+
     # Error handling for admin command group
     #@admin.error
     #async def admin_error(ctx, error):
@@ -163,5 +335,5 @@ class Admin(commands.Cog):
 
 
 async def setup(bot):
-    print("Setting up Admin cog...")
+    log.info("Setting up Admin cog...")
     await bot.add_cog(Admin(bot))
\ No newline at end of file
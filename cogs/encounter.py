@@ -0,0 +1,137 @@
+import discord
+from discord.ext import commands
+import os
+import typing
+from collections import Counter
+from dotenv import load_dotenv
+from utils.database import embed_builder, is_admin, load_bestiary_index, load_armory_index, grant_items, expand_targets
+from utils.armory import armory
+from utils.bestiary import bestiary, SpawnScheduler
+from utils.loot import loot
+from utils.log import get_logger
+
+# Load .env file to get variables
+load_dotenv()
+# Channels where encounters can spawn from chat, comma-separated IDs; empty means every channel
+encounter_channels = {int(channel_id) for channel_id in os.getenv("encounter_channels", "").split(",") if channel_id.strip()}
+# Most kills one !raid may settle, the loot is rolled on the event loop
+raid_max_kills = int(os.getenv("raid_max_kills", "10000"))
+
+log = get_logger("encounter")
+
+class Encounter(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        self.scheduler = SpawnScheduler()
+        self.active = {}  # channel_id -> enemy roaming the channel
+
+    # Chat activity drives the spawns, the rolls themselves never touch the database
+    @commands.Cog.listener()
+    async def on_message(self, message):
+        if message.author.bot or message.guild is None:
+            return
+        if encounter_channels and message.channel.id not in encounter_channels:
+            return
+        if self.scheduler.record(message.channel.id):
+            await self.spawn(message.channel)
+
+    async def spawn(self, channel, element=None, rarity=None):
+        #Draws an enemy for the channel and announces it. Returns the enemy, or None if none match.
+        if not bestiary.ready:
+            await load_bestiary_index()
+
+        enemy = bestiary.draw(element, rarity)
+        if enemy is None:
+            return None
+        nmy_name, nmy_description, _, element, special, hp, attack, speed, rarity, _, nmy_icon = enemy
+
+        # Only the latest encounter of each channel is kept
+        self.active.pop(channel.id, None)
+        self.active[channel.id] = enemy
+        while len(self.active) > self.scheduler.max_channels:
+            self.active.pop(next(iter(self.active)))
+
+        fields = {"HP": hp, "Attack": attack, "Speed": speed, "Rarity": rarity or "Unknown"}
+        if element:
+            fields["Element"] = element
+        if special:
+            fields["Special"] = special
+        embed = embed_builder(
+            title=f"A wild {nmy_name} appears!",
+            description=nmy_description or "Something stirs in the shadows...",
+            fields=fields,
+            thumbnail_url=nmy_icon or None,
+        )
+        await channel.send(embed=embed)
+        log.info(f"{nmy_name} appeared in #{channel}.", extra={"enemy": nmy_name, "channel_id": channel.id})
+        return enemy
+
+    @commands.command(name="spawn", hidden=True, help="Spawns an encounter in this channel, optionally of an element and rarity.\nSyntax: !spawn [element|any] [rarity]")
+    @is_admin()
+    async def force_spawn(self, ctx, element: str = None, rarity: str = None):
+        if element and element.lower() in ("any", "*"):
+            element = None
+        enemy = await self.spawn(ctx.channel, element, rarity)
+        if enemy is None:
+            await ctx.send("No enemy in the bestiary matches that.")
+
+    async def ensure_indexes(self):
+        if not bestiary.ready:
+            await load_bestiary_index()
+        if not armory.ready:
+            await load_armory_index()
+
+    @staticmethod
+    def describe(drops):
+        return ", ".join(f"{item_name} [x{quantity}]" for item_name, quantity in sorted(drops.items())) or "Nothing"
+
+    @commands.command(name="defeat", help="Defeats the enemy roaming this channel and claims its loot.")
+    async def defeat(self, ctx):
+        enemy = self.active.pop(ctx.channel.id, None)
+        if enemy is None:
+            await ctx.send("There is nothing to fight here.")
+            return
+
+        await self.ensure_indexes()
+        drops = loot.roll(enemy[0])
+        await grant_items({ctx.author.id: drops})
+        await ctx.send(f"{ctx.author.mention} defeated **{enemy[0]}**! Loot: {self.describe(drops)}.")
+
+    @commands.command(name="raid", hidden=True, help="Settles a raid: the kills are shared between the participants and all loot is granted at once.\nSyntax: !raid <kills> \"<enemy>\" <@role|@user> [@role|@user ...]")
+    @is_admin()
+    async def raid(self, ctx, kills: int, enemy_name: str, targets: commands.Greedy[typing.Union[discord.Member, discord.Role]]):
+        await self.ensure_indexes()
+        if bestiary.get(enemy_name) is None:
+            await ctx.send(f"There is no **{enemy_name}** in the bestiary.")
+            return
+
+        if kills > raid_max_kills:
+            await ctx.send(f"A raid can settle at most {raid_max_kills} kills at once.")
+            return
+        participants = {member.id: member for member in expand_targets(targets)}
+        if kills <= 0 or not participants:
+            await ctx.send("Please give a positive number of kills and mention at least one role or user.")
+            return
+
+        # Kills are shared out evenly, the first participants take the remainder
+        share, extra = divmod(kills, len(participants))
+        grants = {
+            member_id: loot.roll(enemy_name, share + (1 if i < extra else 0))
+            for i, member_id in enumerate(participants)
+        }
+        granted = await grant_items(grants)
+
+        totals = sum(grants.values(), Counter())
+        embed = embed_builder(
+            title=f"Raid on {enemy_name}",
+            description=f"{kills} kills shared between {len(participants)} participants, {granted} items granted.\n\n**Loot**: {self.describe(totals)}",
+        )
+        await ctx.send(embed=embed)
+        log.info(
+            f"Raid on {enemy_name}: {kills} kills, {len(participants)} participants, {granted} items granted.",
+            extra={"enemy": enemy_name, "kills": kills, "participants": len(participants), "items": granted},
+        )
+
+async def setup(bot):
+    log.info("Setting up Encounter cog...")
+    await bot.add_cog(Encounter(bot))
@@ -4,15 +4,17 @@ from datetime import datetime, timedelta
 import pytz
 import asyncio
 import os
-import sqlite3
+import time
 from dotenv import load_dotenv
-from utils.database import update_crowns, is_admin
+from utils.database import credit_crowns, is_admin, get_perks
+from utils.log import get_logger
 
 # Load .env file to get variables
 load_dotenv()
-db_path = os.getenv("db_path")
 guild_id = int(os.getenv("guild_id"))
 
+log = get_logger("perk")
+
 class Perk(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
@@ -44,42 +46,55 @@ class Perk(commands.Cog):
 
     async def assign_crowns_for_perks(self):
         #Assigns crowns to members based on their roles.
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-
+        #Returns a report of the payout, or None if nothing could be paid.
+        started = time.perf_counter()
         try:
             # Fetch all perks from the database
-            cursor.execute("SELECT id, perk_name, bonus FROM perks_data")
-            perks = cursor.fetchall()
+            perks = await get_perks()
 
             if not perks:
-                print("No perks found in the database.")
+                log.warning("No perks found in the database.")
                 return
             
             # Get the guild object
             guild = self.bot.get_guild(guild_id)
             if not guild:
-                print("Guild not found.")
+                log.error("Guild not found.")
                 return    
             
-            for member in guild.members:
-                earnings = 0  # Reset for each member
-                titles = []  # Collect perk titles for the member              
-                
-                for perk_id, perk_name, bonus in perks:
-                    role = guild.get_role(perk_id)
-                    if role and role in member.roles:  # Check if the member has the perk role
-                        earnings += bonus
-                        titles.append(perk_name)
+            # Walk each perk role's members rather than every member's roles
+            earnings = {}  # member id -> Crowns earned
+            paid_per_perk = {}  # perk name -> members paid
+            missing_roles = []
+            for perk_id, perk_name, bonus in perks:
+                role = guild.get_role(perk_id)
+                if not role:
+                    missing_roles.append(perk_name)
+                    continue
+                members = role.members
+                for member in members:
+                    earnings[member.id] = earnings.get(member.id, 0) + bonus
+                paid_per_perk[perk_name] = len(members)
 
-                if earnings > 0:  # Only update crowns if the member has earned any    
-                    await update_crowns(member.id, earnings, member)
-                    print(f"Added {earnings} Crowns to {member.display_name} for perk(s): {', '.join(titles)}.")
+            # Pay everyone in one transaction
+            paid = await credit_crowns(earnings)
+            report = {
+                "members_paid": paid,
+                "crowns_paid": sum(earnings.values()),
+                "paid_per_perk": paid_per_perk,
+                "missing_roles": missing_roles,
+                "seconds": time.perf_counter() - started,
+            }
+            log.info(
+                f"Perk payout: {report['crowns_paid']} Crowns to {paid} members "
+                f"for {len(paid_per_perk)} perk(s) in {report['seconds'] * 1000:.0f} ms"
+                + (f", roles not found for: {', '.join(missing_roles)}." if missing_roles else "."),
+                extra=report,
+            )
+            return report
     
         except Exception as e:
-            print(f"An error occurred: {e}")
-        finally:
-            conn.close()  # Ensure the connection is always closed
+            log.exception(f"An error occurred: {e}")
 
     @commands.command(name="assigncrowns", help="Manually assign crowns to users based on their perks.", hidden=True)
     @is_admin()
@@ -88,11 +103,20 @@ class Perk(commands.Cog):
         await ctx.send("Assigning crowns to members based on their perks...")
         
         try:
-            await self.assign_crowns_for_perks()  # Call the crown assignment function
-            await ctx.send("Crown assignment completed successfully!")
+            report = await self.assign_crowns_for_perks()  # Call the crown assignment function
+            if report is None:
+                await ctx.send("No Crowns were assigned, check the logs for details.")
+                return
+            per_perk = "\n".join(f"• {name}: {count} member(s)" for name, count in report["paid_per_perk"].items())
+            await ctx.send(
+                f"Crown assignment completed successfully! {report['crowns_paid']} Crowns paid to "
+                f"{report['members_paid']} member(s) in {report['seconds'] * 1000:.0f} ms.\n{per_perk}"
+            )
+            if report["missing_roles"]:
+                await ctx.send(f"Roles not found for perk(s): {', '.join(report['missing_roles'])}.")
         except Exception as e:
             await ctx.send(f"An error occurred during crown assignment: {e}")
 
 async def setup(bot):
-    print("Setting up Perk cog...")
+    log.info("Setting up Perk cog...")
     await bot.add_cog(Perk(bot))
\ No newline at end of file
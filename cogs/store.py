@@ -1,21 +1,262 @@
 import discord 
 from discord.ext import commands
 from discord.ui import Select, View
+import asyncio
 import os
-import sqlite3
+import time
+from collections import OrderedDict
 from dotenv import load_dotenv
-from utils.database import embed_builder, manage_inventory
+from utils.database import embed_builder, buy_item, get_store_categories, load_armory_index
+from utils.armory import armory
+from utils.log import get_logger
 
 # Load .env file to get variables
 load_dotenv()
-db_path = os.getenv("db_path")
+# Number of shoppers that can have the store open at once
+session_limit = int(os.getenv("store_session_limit", "500"))
+# How long (in seconds) an idle store session is kept
+session_ttl = float(os.getenv("store_session_ttl", "300"))
+
+log = get_logger("store")
+
+class StorePageCache:
+    # Rendered store pages, shared by every shopper since a page looks the same for everyone.
+    # Keyed by (category, page, page size) and dropped whenever the armory index is rebuilt.
+    def __init__(self):
+        self.pages = {}  # (category, page, page_size) -> (embed, items on the page)
+        self.armory_version = None
+        self.hits = 0
+        self.misses = 0
+
+    def items(self, category):
+        return armory.catalogue if category == "Catalogue" else armory.by_category.get(category, [])
+
+    def page_count(self, category, page_size):
+        return -(-len(self.items(category)) // page_size)
+
+    def get(self, category, page, page_size):
+        if self.armory_version != armory.version:
+            self.pages.clear()
+            self.armory_version = armory.version
+
+        key = (category, page, page_size)
+        cached = self.pages.get(key)
+        if cached:
+            self.hits += 1
+            return cached
+
+        self.misses += 1
+        items = self.items(category)[page * page_size:(page + 1) * page_size]
+        numbered_items = [
+        f"{index + 1}. **{item[0]}** - {item[1]} Crowns\n{item[2]}"
+        for index, item in enumerate(items)
+        ]
+
+        # Create the embed
+        embed = embed_builder(
+            title=f"{category}s",
+            description="Please press a number button to select the corresponding item.\n\n" + "\n\n".join(numbered_items),
+        )
+        embed.set_footer(text=f"Page {page + 1} of {self.page_count(category, page_size)}")
+
+        self.pages[key] = (embed, items)
+        return self.pages[key]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "cached_pages": len(self.pages),
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+# Shared by all store sessions
+page_cache = StorePageCache()
+
+class StoreSessions:
+    # Open store sessions, one per shopper, least recently used first.
+    # Bounded in size and idle time so shoppers who wander off are dropped.
+    def __init__(self, max_size=session_limit, ttl=session_ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._sessions = OrderedDict()  # user_id -> (view, time last used)
+        self._expiring = set()  # Edits of evicted sessions' messages still in flight
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, user_id):
+        # The shopper's open session, marking it as used
+        entry = self._sessions.get(user_id)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[1] >= self.ttl:
+            self.close(user_id)
+            return None
+        self._sessions[user_id] = (entry[0], time.monotonic())
+        self._sessions.move_to_end(user_id)
+        return entry[0]
+
+    def open(self, user_id, view):
+        self.close(user_id)
+        self._sessions[user_id] = (view, time.monotonic())
+        self.prune()
+
+    def close(self, user_id, view=None):
+        # Close the shopper's session, or only the given one if it is still theirs.
+        # A stopped view no longer answers clicks, so when the registry closes a session
+        # (evicted, expired or replaced) its buttons are taken off the message too.
+        entry = self._sessions.get(user_id)
+        if entry and (view is None or entry[0] is view):
+            del self._sessions[user_id]
+            entry[0].stop()
+            if view is None:
+                task = asyncio.create_task(entry[0].expire())
+                self._expiring.add(task)
+                task.add_done_callback(self._expiring.discard)
+
+    def prune(self):
+        now = time.monotonic()
+        while self._sessions:
+            user_id, (view, last_used) = next(iter(self._sessions.items()))
+            if len(self._sessions) <= self.max_size and now - last_used < self.ttl:
+                break
+            self.close(user_id)
+
+class StorePageView(View):
+    # Buttons for one shopper's store session. Every click edits the same message,
+    # so turning a page or picking an item is a single API call.
+    number_labels = ["1", "2", "3", "4", "5"]
+
+    def __init__(self, cog, ctx, category):
+        super().__init__(timeout=cog.sessions.ttl)
+        self.cog = cog
+        self.ctx = ctx
+        self.owner = ctx.author
+        self.category = category
+        self.current_page = 0
+        self.selected_item = None
+        self.message = None
+
+        self.item_buttons = []
+        for index, label in enumerate(self.number_labels):
+            button = discord.ui.Button(label=label, style=discord.ButtonStyle.primary, row=0)
+            button.callback = self.make_select_callback(index)
+            self.item_buttons.append(button)
+        self.previous_button = self.make_button("⬅️", discord.ButtonStyle.secondary, self.previous_page)
+        self.next_button = self.make_button("➡️", discord.ButtonStyle.secondary, self.next_page)
+        self.back_button = self.make_button("🔙", discord.ButtonStyle.secondary, self.back)
+        self.confirm_button = self.make_button("Buy", discord.ButtonStyle.success, self.confirm)
+        self.cancel_button = self.make_button("Cancel", discord.ButtonStyle.danger, self.cancel)
+
+    def make_button(self, label, style, callback):
+        button = discord.ui.Button(label=label, style=style, row=1)
+        button.callback = callback
+        return button
+
+    def make_select_callback(self, index):
+        async def select(interaction):
+            await self.select_item(interaction, index)
+        return select
+
+    def render(self):
+        # Lay out the buttons for the current page and return its embed
+        page_size = self.cog.items_per_page
+        page_count = page_cache.page_count(self.category, page_size)
+        # The armory may have been reloaded with fewer items since the last click
+        self.current_page = max(0, min(self.current_page, page_count - 1))
+        embed, items = page_cache.get(self.category, self.current_page, page_size)
+
+        self.clear_items()
+        for button in self.item_buttons[:len(items)]:
+            self.add_item(button)
+        if page_count > 1:
+            self.previous_button.disabled = self.current_page == 0
+            self.next_button.disabled = self.current_page >= page_count - 1
+            self.add_item(self.previous_button)
+            self.add_item(self.next_button)
+        self.add_item(self.back_button)
+        return embed
+
+    def render_confirmation(self):
+        item_name, price = self.selected_item[0], self.selected_item[1]
+        self.clear_items()
+        self.add_item(self.confirm_button)
+        self.add_item(self.cancel_button)
+        return embed_builder(
+            title="Confirm purchase",
+            description=f"Are you sure you want to buy **{item_name}** for {price} Crowns?",
+        )
+
+    async def interaction_check(self, interaction):
+        if interaction.user.id != self.owner.id:
+            await interaction.response.send_message("You did not open the store. Please interact with the correct message.", ephemeral=True)
+            return False
+        if self.cog.sessions.get(self.owner.id) is not self:
+            await interaction.response.edit_message(content="This store session has expired. Please open the store again.", view=None)
+            return False
+        return True
+
+    async def select_item(self, interaction, index):
+        _, items = page_cache.get(self.category, self.current_page, self.cog.items_per_page)
+        if index >= len(items):
+            await interaction.response.edit_message(embed=self.render(), view=self)
+            return
+        self.selected_item = items[index]
+        await interaction.response.edit_message(content=None, embed=self.render_confirmation(), view=self)
 
+    async def previous_page(self, interaction):
+        self.current_page -= 1
+        await interaction.response.edit_message(content=None, embed=self.render(), view=self)
+
+    async def next_page(self, interaction):
+        self.current_page += 1
+        await interaction.response.edit_message(content=None, embed=self.render(), view=self)
+
+    async def confirm(self, interaction):
+        # Each click runs as its own task, so a double-click finds the purchase already under way
+        if self.selected_item is None:
+            await interaction.response.defer()
+            return
+        item_name, price = self.selected_item[0], self.selected_item[1]
+        self.selected_item = None
+        # Answer within Discord's deadline even if the purchase has to wait for the database
+        await interaction.response.defer()
+        result = await self.cog.purchase_item(self.owner, item_name, price)
+        await interaction.edit_original_response(content=result, embed=self.render(), view=self)
+
+    async def cancel(self, interaction):
+        self.selected_item = None
+        await interaction.response.edit_message(content="Purchase canceled.", embed=self.render(), view=self)
+
+    async def back(self, interaction):
+        # Return to the main store front
+        self.cog.sessions.close(self.owner.id, self)
+        await interaction.response.edit_message(content="Returning to the store front...", view=None)
+        await self.cog.store(self.ctx)
+
+    async def expire(self):
+        if self.message:
+            try:
+                await self.message.edit(content="This store session has expired. Please open the store again.", view=None)
+            except discord.HTTPException:
+                pass
+
+    async def on_timeout(self):
+        self.cog.sessions.close(self.owner.id, self)
+        if self.message:
+            try:
+                await self.message.edit(content="Store session timed out.", view=None)
+            except discord.HTTPException:
+                pass
 
 class Store(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.items_per_page = 5  # Adjust this number to fit your layout
-        self.store_pages = {}  # Track store pages for each user interaction
+        self.sessions = StoreSessions()  # Open store sessions, by user
+        self.page_cache = page_cache
     
     # DISPLAY STORE. !store !s
     @commands.command(name="store", aliases=["s"], help="Opens up the store for some fashionable shopping~")
@@ -24,13 +265,8 @@ class Store(commands.Cog):
 
         store_user = ctx.author.id
 
-        # Fetch categories from the database
-        with sqlite3.connect(db_path) as conn:
-            cursor = conn.cursor()
-            #cursor.execute("SELECT DISTINCT category_tag FROM armory_data")
-            cursor.execute("SELECT DISTINCT category_tag FROM armory_data WHERE category_tag != ?", ("Debug Item",))
-            #The part after WHERE is to exclude Debug Items from the fetched list.
-            categories = [row[0] for row in cursor.fetchall()]
+        # Fetch categories from the database, Debug Items are excluded
+        categories = await get_store_categories()
 
         if not categories:
             await ctx.send("The store is currently empty.")
@@ -95,165 +331,52 @@ class Store(commands.Cog):
 
     async def show_category(self, ctx, category):
         #Displays the items in the selected category with pagination.
-        # Fetch items for the category
-        with sqlite3.connect(db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT item_name, price, item_description FROM armory_data WHERE category_tag = ?",
-                (category,)
-            )
-            items = cursor.fetchall()
-
-        if not items:
+        if not armory.ready:
+            await load_armory_index()
+
+        if not page_cache.page_count(category, self.items_per_page):
             await ctx.send(f"No items found in category '{category}'.")
             return
 
-        # Paginate the items
-        pages = [items[i:i + self.items_per_page] for i in range(0, len(items), self.items_per_page)]
-
-        # Store the pagination data
-        self.store_pages[ctx.author.id] = {"category": category, "pages": pages, "current_page": 0}
-
         # Display the first page
-        await self.show_page(ctx)
+        await self.show_page(ctx, category)
 
-    async def show_page(self, ctx):
-        #Displays the current page of items.
-        user_data = self.store_pages.get(ctx.author.id)
-        if not user_data:
-            return
-
-        current_page = user_data["current_page"]
-        pages = user_data["pages"]
-        category = user_data["category"]
+    async def show_page(self, ctx, category):
+        #Opens a store session on the first page of the category.
+        view = StorePageView(self, ctx, category)
+        self.sessions.open(ctx.author.id, view)
+        view.message = await ctx.send(embed=view.render(), view=view)
 
-        # Prepare the embed content
-        items = pages[current_page]
-        numbered_items = [
-        f"{index + 1}. **{item[0]}** - {item[1]} Crowns\n{item[2]}"
-        for index, item in enumerate(items)
-        ]
-
-        # Create the embed
-        embed = embed_builder(
-            title=f"{category}s",
-            description="Please react with a number to select the corresponding item.\n\n" + "\n\n".join(numbered_items),
-        )
-        embed.set_footer(text=f"Page {current_page + 1} of {len(pages)}")
-
-        # Send the embed
-        message = await ctx.send(embed=embed)
-
-       # Add reactions for navigation and item selection
-        number_emojis = ["1️⃣", "2️⃣", "3️⃣", "4️⃣", "5️⃣"]
-        for i in range(len(items)):  # Add only as many reactions as there are items
-            await message.add_reaction(number_emojis[i])
-
-        if len(pages) > 1:
-            await message.add_reaction("⬅️")
-            await message.add_reaction("➡️")
-        # Add a back-to-main-store emoji
-        await message.add_reaction("🔙")
-
-        def check(reaction, user):
-            valid_emojis = number_emojis[:len(items)] + ["⬅️", "➡️", "🔙"]
-            return user == ctx.author and str(reaction.emoji) in valid_emojis
-
-        try:
-            reaction, user = await self.bot.wait_for("reaction_add", timeout=300.0, check=check)
-
-            if str(reaction.emoji) == "⬅️" and current_page > 0:
-                user_data["current_page"] -= 1
-                await message.delete()
-                await self.show_page(ctx)
-            elif str(reaction.emoji) == "➡️" and current_page < len(pages) - 1:
-                user_data["current_page"] += 1
-                await message.delete()
-                await self.show_page(ctx)
-            elif str(reaction.emoji) == "🔙":
-                # Return to the main store front
-                await message.delete()
-                await self.store(ctx)  # Call the main store function
-            elif str(reaction.emoji) in number_emojis:
-                selected_index = number_emojis.index(str(reaction.emoji))
-                selected_item = items[selected_index]
-            
-            # Confirm the purchase
-            await ctx.send(f"Are you sure you want to buy **{selected_item[0]}** for {selected_item[1]} Crowns? (y/n)")
-
-            def confirmation_check(m):
-                return m.author == ctx.author and m.content.lower() in ["y", "n"]
-
-            confirmation = await self.bot.wait_for("message", timeout=300.0, check=confirmation_check)
-            if confirmation.content.lower() == "y":
-                # Call a function to handle the purchase logic
-                await self.purchase_item(ctx, user, selected_item[0], selected_item[1])
-            else:
-                await ctx.send("Purchase canceled.")
-        
-            await message.clear_reactions()
-        except TimeoutError:
-            await ctx.send("Purchase timed out.")
-            await message.clear_reactions()
-
-
-    async def purchase_item(self, channel, user, item_name, price):
+    async def purchase_item(self, user, item_name, price):
     
         user_id = str(user.id)
 
-        # Check and update user crowns
-        with sqlite3.connect(db_path) as conn:
-            cursor = conn.cursor()
+        # Deduct the Crowns and add the item to the inventory
+        new_crowns = await buy_item(user_id, item_name, price)
 
-            # Retrieve user's crown balance
-            cursor.execute("SELECT crowns FROM user_data WHERE user_id = ?", (user_id,))
-            result = cursor.fetchone()
-
-            current_crowns = result[0]
-
-            if not current_crowns or current_crowns < price:
-                await channel.send(f"You don't have enough Crowns to buy {item_name}. You need {price} Crowns.")
-                return
+        if new_crowns is None:
+            return f"You don't have enough Crowns to buy {item_name}. You need {price} Crowns."
 
-            # Deduct the Crowns and add the item to the inventory
-            new_crowns = current_crowns - price
-
-            manage_inventory(user_id, item_name, 1)
-            cursor.execute("UPDATE user_data SET crowns = ? WHERE user_id = ?", (new_crowns, user_id))
-
-            conn.commit()
-        await channel.send(f"Successfully bought {item_name} for {price} Crowns! You now have {new_crowns} Crowns left.")    
+        return f"Successfully bought {item_name} for {price} Crowns! You now have {new_crowns} Crowns left."
 
     
     # CATALOGUE OF ALPHABETICALLY ORGANISED ITEMS
     @commands.command(name="catalogue", help="Showcases a catalogue of all items available for purchase listed in alphabetical order.")
     async def storecatalogue(self, ctx):
-        # Step 1: Query the database for items
-        with sqlite3.connect(db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT item_name, price, item_description, category_tag, species_tag FROM armory_data ORDER BY item_name"
-            )
-            items = cursor.fetchall()
-
-        if not items:
+        if not armory.ready:
+            await load_armory_index()
+
+        if not armory.catalogue:
             await ctx.send("The catalogue is empty!")
             return
 
-        # Paginate the items
-        pages = [items[i:i + self.items_per_page] for i in range(0, len(items), self.items_per_page)]
-
-        category = "Catalogue"
-        # Store the pagination data
-        self.store_pages[ctx.author.id] = {"category": category, "pages": pages, "current_page": 0}
-
         # Display the first page
-        await self.show_page(ctx)
+        await self.show_page(ctx, "Catalogue")
 
     # SELL ITEM. !sell
     #@commands.command(name="sell", help="Allows you to cash in the hard-earned fruits of your laborious questing.")
     #async def sell_item     
 
 async def setup(bot):
-    print("Setting up Store cog...")
+    log.info("Setting up Store cog...")
     await bot.add_cog(Store(bot))
\ No newline at end of file
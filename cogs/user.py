@@ -1,10 +1,15 @@
+import discord
 from discord import Message
 from discord.ext import commands
 import os
 import json
 import re
 from dotenv import load_dotenv
-from utils.database import get_user_data, get_leaderboard, give_crowns, embed_builder, manage_user_characters
+from utils.database import get_user_data, get_leaderboard, give_crowns_batch, embed_builder, manage_user_characters
+from utils.accrual import crown_buffer
+from utils.identity import resolver
+from utils.leaderboard import leaderboard as ranking
+from utils.log import get_logger
 
 # Load .env file to get variables
 load_dotenv()
@@ -18,15 +23,21 @@ url_pattern = re.compile(
     #r'(\/\S*)?$'  # Path
 )
 
+log = get_logger("user")
+
 class User(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
+    async def cog_unload(self):
+        # Don't leave message Crowns behind when the cog is reloaded
+        await crown_buffer.flush()
+
     #BALANCE. !balance
     @commands.command(name="balance", help="Shows your current Crowns balance.")
     async def balance(self, ctx):
         user_id = str(ctx.author.id)
-        user_data = get_user_data(user_id)
+        user_data = await get_user_data(user_id)
         if user_data:
             crowns, inventory, characters = user_data
             await ctx.send(f"Hello {ctx.author.display_name}! You have {crowns} Crowns.")
@@ -34,24 +45,30 @@ class User(commands.Cog):
             await ctx.send("You don't have any funds yet. Start chatting to earn Crowns!")
 
     #GIVE MONEY TO OTHER USER. !give
-    @commands.command(name="give", help="Gift Crowns to another user.\nSyntax: !give <amount> @user")
-    async def give(self, ctx, amount: int, member: commands.MemberConverter):
+    @commands.command(name="give", help="Gift Crowns to one or more users, each of them gets the amount.\nSyntax: !give <amount> @user [@user ...]")
+    async def give(self, ctx, amount: int, members: commands.Greedy[discord.Member]):
             
             if amount <= 0:
                 await ctx.send("You cannot give a negative amount.")
                 return
+
+            if not members:
+                await ctx.send("Please mention who you want to give Crowns to.\n The correct syntax is as follows: **!give <amount> @user [@user ...]**.")
+                return
             
             sender_id = ctx.author.id
-            recipient_id = member.id
+            # Drop duplicate mentions, keeping their order
+            recipients = list({member.id: member for member in members}.values())
 
-            if sender_id == recipient_id:
+            if any(member.id == sender_id for member in recipients):
                 await ctx.send("You cannot give Crowns to yourself.")
                 return
     
-            success = give_crowns(sender_id, amount, recipient_id)
+            remaining = await give_crowns_batch(sender_id, amount, [member.id for member in recipients])
 
-            if success:
-                await ctx.send(f"{ctx.author.mention} gave {amount} Crowns to {member.mention}!")
+            if remaining is not None:
+                mentions = ", ".join(member.mention for member in recipients)
+                await ctx.send(f"{ctx.author.mention} gave {amount} Crowns to {mentions}!")
             else:
                 await ctx.send("You do not have enough Crowns for this transaction or the user does not exist in my database.")
 
@@ -61,7 +78,7 @@ class User(commands.Cog):
     async def profile(self, ctx):
         user_id = str(ctx.author.id)
 
-        result = get_user_data(user_id)
+        result = await get_user_data(user_id)
 
         if result is None:
             await ctx.send(f"Your data does not exist. Please message to start!")
@@ -70,11 +87,10 @@ class User(commands.Cog):
         crowns, inventory, characters = result
         # vv debugging line to print inventory into console logs
         #print(inventory)
-        inventory = json.loads(inventory)  # Convert the string list back to a Python list
         characters = json.loads(characters)
 
         if inventory:
-            inventory_list = "\n".join([f"{item['item_name']} [x{item['quantity']}]" for item in inventory])
+            inventory_list = "\n".join([f"{item_name} [x{quantity}]" for item_name, quantity in inventory])
         else:
             inventory_list = "No items."
         
@@ -83,8 +99,8 @@ class User(commands.Cog):
         else:
             characters_list = "No characters."
         
-        user = await self.bot.fetch_user(int(user_id))
-        avatar_url = user.avatar.url
+        user = await resolver.resolve(self.bot, user_id, ctx.guild)
+        avatar_url = user.display_avatar.url
         fields = {
         "Inventory": str(inventory_list),
         "Characters": str(characters_list)
@@ -103,17 +119,16 @@ class User(commands.Cog):
     async def inventory(self, ctx):
         user_id = str(ctx.author.id)
         
-        result = get_user_data(user_id)
+        result = await get_user_data(user_id)
 
         if result is None:
             await ctx.send(f"Your data does not exist. Please message to start!")
             return
 
         crowns, inventory, characters = result
-        inventory = json.loads(inventory)  # Convert the string list back to a Python list
 
         if inventory:
-            inventory_list = "\n".join([f"{item['item_name']} [x{item['quantity']}]" for item in inventory])
+            inventory_list = "\n".join([f"{item_name} [x{quantity}]" for item_name, quantity in inventory])
             await ctx.send(f"Your inventory:\n{inventory_list}")
         else:
             await ctx.send("Your inventory is empty.")
@@ -136,7 +151,7 @@ class User(commands.Cog):
                     await self.add_character_help(ctx)
                     return
                 
-                manage_user_characters(user_id, name, title, sheet_url, action="add")
+                await manage_user_characters(user_id, name, title, sheet_url, action="add")
                 await ctx.send(f"Character '{name}' added successfully!")
             
             elif action == "remove":
@@ -144,7 +159,7 @@ class User(commands.Cog):
                     await ctx.send("Please provide the name of the character to remove.\n The correct syntax is as follows: **!character remove <name>**.")
                     return
                 
-                manage_user_characters(user_id, name, None, None, action="remove")
+                await manage_user_characters(user_id, name, None, None, action="remove")
                 await ctx.send(f"Character '{name}' removed successfully!")
             
             else:
@@ -152,7 +167,7 @@ class User(commands.Cog):
                 await self.add_character_help(ctx)
         
         except Exception as e:
-            await print(f"An error occurred: {e}")
+            log.exception(f"An error occurred: {e}")
             await ctx.send(f"An error occurred! Better poke an admin.")
 
     # help function for character adding (on user's request)
@@ -198,26 +213,58 @@ class User(commands.Cog):
                 return
 
             user_id = str(ctx.author.id)
-            manage_user_characters(user_id, char_name, char_title, sheet_url, action="add")
+            await manage_user_characters(user_id, char_name, char_title, sheet_url, action="add")
             await ctx.send(f"Character **{char_name}** has been added successfully!")
                     
         except TimeoutError:
             await ctx.send("You took too long to respond! Please try the command again.")
         except Exception as e:
-            await print(f"An error occurred: {e}")
+            log.exception(f"An error occurred: {e}")
             await ctx.send(f"An error occurred! Better poke an admin.")
 
     #LEADERBOARD. !leaderboard
-    @commands.command(name="leaderboard", aliases=["l"], help="Displays the top 10 leaderboard.")
-    async def leaderboard(self, ctx):
-        leaderboard_data = get_leaderboard()
-        leaderboard_message = "🏆 **Leaderboard** 🏆\n"
-        for rank, (user_id, crowns) in enumerate(leaderboard_data, start=1):
-            user = await self.bot.fetch_user(int(user_id))
+    @commands.command(name="leaderboard", aliases=["l"], help="Displays the leaderboard, 10 places per page.\nSyntax: !leaderboard [page]")
+    async def leaderboard(self, ctx, page: int = 1):
+        page_size = 10
+        if not ranking.ready:
+            # Until the ranking is loaded only the top 10 can be read from the database
+            if page != 1:
+                await ctx.send("The leaderboard is still loading, only the first page is available for now.")
+                return
+            leaderboard_data = await get_leaderboard()
+            pages = 1
+        else:
+            pages = max(1, -(-len(ranking) // page_size))
+            if page < 1 or page > pages:
+                await ctx.send(f"There are only {pages} pages on the leaderboard.")
+                return
+            # Every page is a slice of the in-memory ranking, so pages agree with each other and with !rank
+            leaderboard_data = ranking.page((page - 1) * page_size, page_size)
+
+        leaderboard_message = "🏆 **Leaderboard** 🏆\n" if page == 1 else f"🏆 **Leaderboard** (page {page} of {pages}) 🏆\n"
+        for rank, (user_id, crowns) in enumerate(leaderboard_data, start=(page - 1) * page_size + 1):
+            user = await resolver.resolve(self.bot, user_id, ctx.guild)
             leaderboard_message += f"{rank}. {user.display_name}: {crowns} Crowns\n"
 
         await ctx.send(leaderboard_message)
 
+    #RANK. !rank
+    @commands.command(name="rank", aliases=["r"], help="Shows where you (or someone else) stand on the leaderboard.\nSyntax: !rank [@user]")
+    async def rank(self, ctx, member: discord.Member = None):
+        member = member or ctx.author
+        neighbours = ranking.around(member.id)
+        if not neighbours:
+            await ctx.send(f"{member.display_name} is not on the leaderboard yet. Start chatting to earn Crowns!")
+            return
+
+        rank_message = f"**{member.display_name}** is ranked **#{ranking.rank(member.id)}** of {len(ranking)}.\n"
+        for rank, user_id, crowns in neighbours:
+            user = await resolver.resolve(self.bot, user_id, ctx.guild)
+            line = f"{rank}. {user.display_name}: {crowns} Crowns"
+            rank_message += f"**{line}**\n" if user_id == str(member.id) else f"{line}\n"
+
+        await ctx.send(rank_message)
+
     #HELP. !help
     @commands.command(name="help", aliases=["h"], hidden=True)
     async def help(self, ctx):
@@ -237,5 +284,5 @@ class User(commands.Cog):
         await ctx.send(embed=embed)
 
 async def setup(bot):
-    print("Setting up User cog...")
+    log.info("Setting up User cog...")
     await bot.add_cog(User(bot))
\ No newline at end of file
@@ -0,0 +1,147 @@
+import asyncio
+import os
+from dotenv import load_dotenv
+from utils.db_pool import pool
+from utils.leaderboard import leaderboard
+from utils.log import get_logger, EventSummary
+from utils.metrics import timed
+
+# Load .env file to get variables
+load_dotenv()
+# Longest time (in seconds) earned Crowns may sit in memory before they are written to the database
+max_staleness = float(os.getenv("accrual_max_staleness", "5"))
+# Number of users with unflushed Crowns that triggers an early flush
+max_pending = int(os.getenv("accrual_max_pending", "500"))
+
+# Adds the delta to an existing user or creates the user with it
+UPSERT_CROWNS = """
+INSERT INTO user_data (user_id, crowns, inventory)
+VALUES (?, ?, '[]')
+ON CONFLICT(user_id) DO UPDATE SET crowns = crowns + excluded.crowns
+"""
+
+log = get_logger("accrual")
+
+class CrownBuffer:
+    # Write-behind buffer for message Crowns.
+    # on_message only adds to a dict; the deltas are written in one transaction
+    # every max_staleness seconds, or sooner once max_pending users are waiting.
+    def __init__(self, max_staleness=max_staleness, max_pending=max_pending):
+        self.max_staleness = max_staleness
+        self.max_pending = max_pending
+        self.pending = {}  # user_id -> Crowns not yet handed to the database
+        self.flushing = {}  # user_id -> Crowns in the transaction currently being written
+        self._lock = None
+        self._task = None
+        self._early_flush = None
+        # Message Crowns are logged as periodic totals rather than per message
+        self.summary = EventSummary(log, "Message Crowns earned")
+        self.messages_accrued = 0
+        self.crowns_accrued = 0
+
+    def start(self):
+        # The lock and task are created lazily so they bind to the bot's running loop
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        # Cancel the timer and write whatever is left. A flush already in flight is shielded
+        # from the cancel, and the final flush waits on the lock until it has committed.
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    def add(self, user_id, amount):
+        # Users are recorded even for 0 Crowns so that chatting still creates their profile
+        user_id = str(user_id)
+        self.pending[user_id] = self.pending.get(user_id, 0) + amount
+        leaderboard.add(user_id, amount)
+        self.summary.add(messages=1, crowns=amount)
+        self.messages_accrued += 1
+        self.crowns_accrued += amount
+        self.start()
+
+        if len(self.pending) >= self.max_pending and (self._early_flush is None or self._early_flush.done()):
+            self._early_flush = asyncio.create_task(self._flush_early())
+
+    def pending_for(self, user_id):
+        # Crowns earned by a user that are not committed yet
+        user_id = str(user_id)
+        return self.pending.get(user_id, 0) + self.flushing.get(user_id, 0)
+
+    def is_pending(self, user_id):
+        user_id = str(user_id)
+        return user_id in self.pending or user_id in self.flushing
+
+    def take(self, user_id):
+        # Remove and return a user's pending Crowns so a transaction can apply them itself
+        return self.pending.pop(str(user_id), 0)
+
+    def restore(self, user_id, amount):
+        # Give back Crowns from take() when that transaction failed
+        if amount:
+            user_id = str(user_id)
+            self.pending[user_id] = self.pending.get(user_id, 0) + amount
+
+    async def apply_pending(self, conn, user_id):
+        # Write a user's pending Crowns on the given (open) transaction.
+        # Returns the amount, which must be restore()d if the transaction rolls back.
+        amount = self.take(user_id)
+        if amount:
+            await conn.execute(UPSERT_CROWNS, (str(user_id), amount))
+        return amount
+
+    def snapshot(self):
+        # All unflushed deltas, including the batch being written right now
+        deltas = dict(self.flushing)
+        for user_id, amount in self.pending.items():
+            deltas[user_id] = deltas.get(user_id, 0) + amount
+        return deltas
+
+    @timed("crown_buffer.flush")
+    async def flush(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            if not self.pending:
+                return 0
+
+            self.flushing, self.pending = self.pending, {}
+            try:
+                async with pool.transaction() as conn:
+                    await conn.executemany(UPSERT_CROWNS, list(self.flushing.items()))
+            except Exception:
+                # Keep the Crowns so the next flush can retry them
+                for user_id, amount in self.flushing.items():
+                    self.pending[user_id] = self.pending.get(user_id, 0) + amount
+                raise
+            finally:
+                flushed = len(self.flushing)
+                self.flushing = {}
+
+        log.debug(f"Flushed message Crowns for {flushed} users.", extra={"users": flushed})
+        self.summary.add(flushes=1, users_flushed=flushed)
+        return flushed
+
+    async def _flush_early(self):
+        # Nothing awaits this task, so failures are logged here like the timer's
+        try:
+            await self.flush()
+        except Exception as e:
+            log.exception(f"Failed to flush message Crowns: {e}")
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.max_staleness)
+            try:
+                # Cancelling the loop must not abort a batch halfway through its transaction
+                await asyncio.shield(self.flush())
+            except Exception as e:
+                log.exception(f"Failed to flush message Crowns: {e}")
+
+# Shared buffer used by on_message and the balance reads
+crown_buffer = CrownBuffer()
@@ -0,0 +1,35 @@
+# Categories that are never shown in the store
+HIDDEN_CATEGORIES = ("Debug Item",)
+
+class ArmoryIndex:
+    # In-memory copy of armory_data so the store can be browsed without queries.
+    # Rebuilt only when the armory is (re)imported.
+    def __init__(self):
+        self.items = {}  # item_name -> (item_name, price, item_description, category_tag, species_tag)
+        self.categories = []  # store categories, in table order
+        self.by_category = {}  # category -> [(item_name, price, item_description)]
+        self.catalogue = []  # every item, sorted by name
+        self.version = 0  # bumped on every rebuild, so caches built on top can tell they are stale
+        self.ready = False
+
+    def load(self, rows):
+        # rows are (item_name, price, item_description, category_tag, species_tag)
+        items = {}
+        by_category = {}
+        for row in rows:
+            item_name, price, item_description, category_tag, _ = row
+            items[item_name] = tuple(row)
+            by_category.setdefault(category_tag, []).append((item_name, price, item_description))
+
+        self.items = items
+        self.by_category = by_category
+        self.categories = [category for category in by_category if category is not None and category not in HIDDEN_CATEGORIES]
+        self.catalogue = sorted(items.values())
+        self.version += 1
+        self.ready = True
+
+    def get(self, item_name):
+        return self.items.get(item_name)
+
+# Shared index, loaded by the bot on startup
+armory = ArmoryIndex()
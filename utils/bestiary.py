@@ -0,0 +1,118 @@
+import os
+import random
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+# Load .env file to get variables
+load_dotenv()
+# Messages a channel needs since its last encounter before it can roll another
+encounter_messages = int(os.getenv("encounter_messages", "25"))
+# Shortest time (in seconds) between two encounters in the same channel
+encounter_cooldown = float(os.getenv("encounter_cooldown", "300"))
+# Chance that an eligible message actually spawns an encounter
+encounter_chance = float(os.getenv("encounter_chance", "0.2"))
+# Number of channels whose activity is tracked, the least recently active are forgotten first
+encounter_max_channels = int(os.getenv("encounter_max_channels", "1000"))
+
+class AliasTable:
+    # Vose's alias method: O(n) to build, O(1) per weighted draw.
+    def __init__(self, weights):
+        count = len(weights)
+        total = sum(weights)
+        self.probability = [0.0] * count
+        self.alias = [0] * count
+        scaled = [weight * count / total for weight in weights]
+        small = [i for i, weight in enumerate(scaled) if weight < 1.0]
+        large = [i for i, weight in enumerate(scaled) if weight >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self.probability[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] -= 1.0 - scaled[less]
+            (small if scaled[more] < 1.0 else large).append(more)
+        # Whatever is left is 1 up to rounding
+        for i in small + large:
+            self.probability[i] = 1.0
+
+    def draw(self, rng=random):
+        column = rng.randrange(len(self.probability))
+        return column if rng.random() < self.probability[column] else self.alias[column]
+
+class BestiaryIndex:
+    # In-memory copy of the bestiary for spawning encounters without queries.
+    # Alias tables are built per (element, rarity) filter the first time it is used,
+    # and all of them are dropped when the bestiary is (re)imported.
+    def __init__(self):
+        self.enemies = {}  # nmy_name -> (nmy_name, nmy_description, drop_pool, element, special, hp, attack, speed, rarity, encounter_rate, nmy_icon)
+        self.tables = {}  # (element, rarity) -> (enemy rows, AliasTable), or None if nothing matches
+        self.version = 0
+        self.ready = False
+
+    def load(self, rows):
+        self.enemies = {row[0]: tuple(row) for row in rows}
+        self.tables = {}
+        self.version += 1
+        self.ready = True
+
+    def get(self, nmy_name):
+        return self.enemies.get(nmy_name)
+
+    def table(self, element=None, rarity=None):
+        key = (element.lower() if element else None, str(rarity).lower() if rarity is not None else None)
+        if key not in self.tables:
+            rows = [
+                row for row in self.enemies.values()
+                if (row[9] or 0) > 0
+                and (key[0] is None or (row[3] or "").lower() == key[0])
+                and (key[1] is None or (row[8] or "").lower() == key[1])
+            ]
+            self.tables[key] = (rows, AliasTable([row[9] for row in rows])) if rows else None
+        return self.tables[key]
+
+    def draw(self, element=None, rarity=None, rng=random):
+        # A random enemy weighted by encounter_rate, or None if none match the filters
+        table = self.table(element, rarity)
+        if table is None:
+            return None
+        rows, alias = table
+        return rows[alias.draw(rng)]
+
+class SpawnScheduler:
+    # Decides when a channel gets an encounter, from its message activity alone.
+    # A channel becomes eligible after `messages` messages and `cooldown` seconds since
+    # its last encounter; each eligible message then spawns with probability `chance`.
+    def __init__(self, messages=encounter_messages, cooldown=encounter_cooldown, chance=encounter_chance,
+                 max_channels=encounter_max_channels, rng=None):
+        self.messages = messages
+        self.cooldown = cooldown
+        self.chance = chance
+        self.max_channels = max_channels
+        self.rng = rng or random.Random()
+        self._channels = OrderedDict()  # channel_id -> [messages since last encounter, time of last encounter]
+        self.spawns = 0
+
+    def __len__(self):
+        return len(self._channels)
+
+    def record(self, channel_id, now=None):
+        # Count a message in the channel, True if it should spawn an encounter now
+        now = time.monotonic() if now is None else now
+        state = self._channels.get(channel_id)
+        if state is None:
+            state = self._channels[channel_id] = [0, float("-inf")]
+            while len(self._channels) > self.max_channels:
+                self._channels.popitem(last=False)
+        else:
+            self._channels.move_to_end(channel_id)
+        state[0] += 1
+
+        if state[0] < self.messages or now - state[1] < self.cooldown or self.rng.random() >= self.chance:
+            return False
+        state[0] = 0
+        state[1] = now
+        self.spawns += 1
+        return True
+
+# Shared index, loaded by the bot on startup
+bestiary = BestiaryIndex()
@@ -1,10 +1,20 @@
 import discord
 from discord.ext import commands
 import sqlite3
-import aiosqlite
+import asyncio
+import gzip
+import hashlib
+import itertools
 import json
 import os
 from dotenv import load_dotenv
+from utils.accrual import crown_buffer, UPSERT_CROWNS
+from utils.db_pool import pool
+from utils.leaderboard import leaderboard
+from utils.armory import armory
+from utils.bestiary import bestiary
+from utils.log import get_logger
+from utils.metrics import timed
 
 # Load .env file to get variables
 load_dotenv()
@@ -15,218 +25,428 @@ perks_path = os.getenv("perks_path")
 admin_roles = [int(role_id) for role_id in os.getenv("admin_roles", "").split(",")]
 export_path = os.getenv("userexport_path")
 guild_id = os.getenv("guild_id")
+# Streaming exports are written next to the legacy JSON export
+export_base = os.path.splitext(export_path)[0]
+full_export_path = export_base + ".ndjson.gz"
+incremental_export_path = export_base + ".incremental.ndjson.gz"
+# Imports log their progress every this many chunks
+import_progress_every = int(os.getenv("import_progress_every", "50"))
+
+log = get_logger("database")
+
+# Adds to the quantity of an item the user already has, or creates the row
+UPSERT_INVENTORY = """
+INSERT INTO inventory (user_id, item_name, quantity)
+VALUES (?, ?, ?)
+ON CONFLICT(user_id, item_name) DO UPDATE SET quantity = quantity + excluded.quantity
+"""
+
+INVENTORY_QUERY = "SELECT item_name, quantity FROM inventory WHERE user_id = ? ORDER BY item_name"
+
+# Current time in milliseconds, as stored in user_data.updated_at
+NOW_MS = "CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER)"
 
 # SQLite Database initialization
 
-def init_db():
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    # Create the user_data table if it doesn't exist
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS user_data (
-        user_id TEXT PRIMARY KEY,
-        crowns INTEGER DEFAULT 0,
-        inventory TEXT DEFAULT '[]',
-        characters TEXT DEFAULT '[]'
-    )
-    """)
+async def init_db():
+    await create_schema()
+    await seed_data()
+
+# Create the tables and run the schema migrations
+async def create_schema():
+    async with pool.transaction() as conn:
+        # Create the user_data table if it doesn't exist
+        await conn.execute("""
+        CREATE TABLE IF NOT EXISTS user_data (
+            user_id TEXT PRIMARY KEY,
+            crowns INTEGER DEFAULT 0,
+            inventory TEXT DEFAULT '[]',
+            characters TEXT DEFAULT '[]'
+        )
+        """)
 
-    if os.path.exists(export_path):
-        import_user_data()
-
-    # Create the armory_data table if it doesn't exist
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS armory_data (
-        item_name TEXT PRIMARY KEY,
-        price INTEGER NOT NULL,
-        item_description TEXT,
-        category_tag TEXT,
-        species_tag TEXT,
-        item_icon TEXT
-    )
-    """)
+        # Create the inventory table if it doesn't exist, one row per item a user owns
+        await conn.execute("""
+        CREATE TABLE IF NOT EXISTS inventory (
+            user_id TEXT NOT NULL,
+            item_name TEXT NOT NULL,
+            quantity INTEGER NOT NULL,
+            PRIMARY KEY (user_id, item_name)
+        ) WITHOUT ROWID
+        """)
+
+        # Move inventories out of the old user_data.inventory JSON blobs, once
+        async with conn.execute("PRAGMA user_version") as cursor:
+            schema_version = (await cursor.fetchone())[0]
+        if schema_version < 1:
+            await migrate_inventory_blobs(conn)
+            await conn.execute("PRAGMA user_version = 1")
+        if schema_version < 2:
+            await add_change_tracking(conn)
+            await conn.execute("PRAGMA user_version = 2")
+
+        # The leaderboard is paged from memory, the crowns index only slowed down every Crown write
+        await conn.execute("DROP INDEX IF EXISTS idx_user_data_crowns")
+
+        # Small key/value table for bookkeeping such as the export watermark
+        await conn.execute("""
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+        """)
+
+        # Create the armory_data table if it doesn't exist
+        await conn.execute("""
+        CREATE TABLE IF NOT EXISTS armory_data (
+            item_name TEXT PRIMARY KEY,
+            price INTEGER NOT NULL,
+            item_description TEXT,
+            category_tag TEXT,
+            species_tag TEXT,
+            item_icon TEXT
+        )
+        """)
+
+        #Creates the bestiary table in the database if it doesn't already exist.
+        await conn.execute("""
+        CREATE TABLE IF NOT EXISTS bestiary (
+            nmy_name TEXT PRIMARY KEY,
+            nmy_description TEXT,
+            drop_pool TEXT DEFAULT '[]',
+            element TEXT,
+            special TEXT,
+            hp INTEGER NOT NULL,
+            attack INTEGER,
+            speed INTEGER,
+            rarity TEXT,
+            encounter_rate REAL,
+            nmy_icon TEXT
+        )
+        """)
+
+        # Create the perks_data table if it doesn't exist
+        await conn.execute("""
+        CREATE TABLE IF NOT EXISTS perks_data (
+            id INTEGER PRIMARY KEY,
+            perk_name TEXT,
+            bonus INTEGER DEFAULT 0
+        )
+        """)
+
+# Fill the tables from the data files
+async def seed_data():
+    # Each import is skipped when its file hasn't changed since the last run
+    if user_export_to_import():
+        await import_user_data_if_changed()
 
     if os.path.exists(armory_path):
-        import_armory_items()
-
-    #Creates the bestiary table in the database if it doesn't already exist.
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS bestiary (
-        nmy_name TEXT PRIMARY KEY,
-        nmy_description TEXT,
-        drop_pool TEXT DEFAULT '[]',
-        element TEXT,
-        special TEXT,
-        hp INTEGER NOT NULL,
-        attack INTEGER,
-        speed INTEGER,
-        rarity TEXT,
-        encounter_rate REAL,
-        nmy_icon TEXT
-    )
-    """)
+        await import_armory_items()
 
     if os.path.exists(bestiary_path):
-        import_bestiary()
-
-    # Create the perks_data table if it doesn't exist
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS perks_data (
-        id INTEGER PRIMARY KEY,
-        perk_name TEXT,
-        bonus INTEGER DEFAULT 0
+        await import_bestiary()
+
+    if os.path.exists(perks_path):
+        await import_perks_info()
+
+# Copy every user_data.inventory JSON blob into the inventory table and empty the blob
+async def migrate_inventory_blobs(conn):
+    rows = await conn.execute_fetchall(
+        "SELECT user_id, inventory FROM user_data WHERE inventory IS NOT NULL AND inventory NOT IN ('', '[]')"
     )
+    items = []
+    for user_id, inventory in rows:
+        try:
+            for item in json.loads(inventory):
+                if item.get("quantity", 0) > 0:
+                    items.append((user_id, item["item_name"], item["quantity"]))
+        except (json.JSONDecodeError, KeyError, TypeError, AttributeError) as e:
+            log.warning(f"Skipping unreadable inventory of user {user_id}: {e}", extra={"user_id": user_id})
+
+    await conn.executemany(UPSERT_INVENTORY, items)
+    await conn.execute("UPDATE user_data SET inventory = '[]' WHERE inventory != '[]'")
+    log.info(f"Migrated {len(items)} inventory entries from {len(rows)} users to the inventory table.", extra={"entries": len(items), "users": len(rows)})
+
+# Stamp user_data.updated_at whenever a user's Crowns, characters or items change,
+# so incremental exports only have to read the users touched since the last one
+async def add_change_tracking(conn):
+    await conn.execute("ALTER TABLE user_data ADD COLUMN updated_at INTEGER NOT NULL DEFAULT 0")
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_user_data_updated_at ON user_data(updated_at)")
+    await conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS user_data_inserted AFTER INSERT ON user_data
+    BEGIN
+        UPDATE user_data SET updated_at = {NOW_MS} WHERE user_id = NEW.user_id;
+    END
+    """)
+    await conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS user_data_updated AFTER UPDATE OF crowns, characters ON user_data
+    BEGIN
+        UPDATE user_data SET updated_at = {NOW_MS} WHERE user_id = NEW.user_id;
+    END
     """)
+    for event, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+        await conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS inventory_{event.lower()}d AFTER {event} ON inventory
+        BEGIN
+            UPDATE user_data SET updated_at = {NOW_MS} WHERE user_id = {row}.user_id;
+        END
+        """)
 
-    if os.path.exists(perks_path):
-        import_perks_info()
+# Rows of the seeded tables, typed the way SQLite returns them so they compare equal
+def text(value):
+    return None if value is None else str(value)
 
-    conn.commit()
-    conn.close()
+def integer(value):
+    return None if value is None else int(value)
 
-def import_armory_items():
-    try: 
-        # Load the items from the JSON file           
-        armory_items = load_armory_json()
-        
-        # Open a connection to the database
-        with sqlite3.connect(db_path) as conn:
-            cursor = conn.cursor()
-
-            # Insert items into the store_items table
-            for item_name, item_data, in armory_items.items():
-
-                # Use INSERT OR REPLACE to ensure we don't add duplicate items
-                try:
-                    cursor.execute("""
-                    INSERT OR REPLACE INTO armory_data (item_name, price, item_description, category_tag, species_tag, item_icon)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                    """, (item_name, item_data["price"], item_data["item_description"], item_data["category_tag"], item_data["species_tag"], item_data.get("item_icon")))
-                except sqlite3.Error as e:
-                    print(f"Error occurred while inserting {item_name}: {e}")
-
-            # Commit the transaction to save changes
-            conn.commit()
-        
-        print("Items successfully added to the store!")  
-    except FileNotFoundError:
-        print("The inventory JSON file could not be found.")
+def real(value):
+    return None if value is None else float(value)
 
-def import_bestiary():
-    try:          
-        bestiary_items = load_bestiary_json()
-        
-        with sqlite3.connect(db_path) as conn:
-            cursor = conn.cursor()
-
-            for nmy_name, nmy_data, in bestiary_items.items():
-
-                # Use INSERT OR REPLACE to ensure we don't add duplicate items
-                try:
-                    cursor.execute("""
-                    INSERT OR REPLACE INTO bestiary (nmy_name, nmy_description, drop_pool, element, special, hp, attack, speed, rarity, encounter_rate, nmy_icon)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """, (nmy_name, nmy_data["nmy_description"], nmy_data["drop_pool"], nmy_data["element"], nmy_data["special"], nmy_data["hp"], nmy_data["attack"], nmy_data["speed"], nmy_data["rarity"], nmy_data["encounter_rate"], nmy_data.get("nmy_icon"), ))
-                except sqlite3.Error as e:
-                    print(f"Error occurred while inserting {nmy_name}: {e}")
-            
-            conn.commit()
-        
-        print("Enemies successfully added to the bestiary!")  
-    except FileNotFoundError:
-        print("The bestiary JSON file could not be found.")
-
-def import_perks_info():
-    try: 
-        # Load the items from the JSON file           
-        perks_info = load_perks_info()
-        
-        # Open a connection to the database
-        with sqlite3.connect(db_path) as conn:
-            cursor = conn.cursor()
-
-            # Insert items into the store_items table
-            for id, perk_data, in perks_info.items():
-
-                # Use INSERT OR REPLACE to ensure we don't add duplicate items
-                try:
-                    cursor.execute("""
-                    INSERT OR REPLACE INTO perks_data (id, perk_name, bonus)
-                    VALUES (?, ?, ?)
-                    """, (id, perk_data["perk_name"], perk_data["bonus"]))
-                except sqlite3.Error as e:
-                    print(f"Error occurred while inserting {id}: {e}")
-
-            # Commit the transaction to save changes
-            conn.commit()
-        
-        print("Perks successfully added to the table!")  
-    except FileNotFoundError:
-        print("The perks JSON file could not be found.")
+def armory_row(item_name, item_data):
+    return (
+        item_name, int(item_data["price"]), text(item_data["item_description"]), text(item_data["category_tag"]),
+        text(item_data["species_tag"]), text(item_data.get("item_icon")),
+    )
+
+def bestiary_row(nmy_name, nmy_data):
+    drop_pool = nmy_data["drop_pool"]
+    return (
+        nmy_name, text(nmy_data["nmy_description"]),
+        drop_pool if isinstance(drop_pool, str) else json.dumps(drop_pool),
+        text(nmy_data["element"]), text(nmy_data["special"]), int(nmy_data["hp"]), integer(nmy_data["attack"]),
+        integer(nmy_data["speed"]), text(nmy_data["rarity"]), real(nmy_data["encounter_rate"]), text(nmy_data.get("nmy_icon")),
+    )
 
-def import_user_data():
+def perk_row(id, perk_data):
+    return (int(id), text(perk_data["perk_name"]), int(perk_data["bonus"]))
+
+# Datasets seeded from JSON files: name -> (JSON path, table, columns, row builder)
+DATASETS = {
+    "armory": (armory_path, "armory_data",
+               ("item_name", "price", "item_description", "category_tag", "species_tag", "item_icon"), armory_row),
+    "bestiary": (bestiary_path, "bestiary",
+                 ("nmy_name", "nmy_description", "drop_pool", "element", "special", "hp", "attack", "speed",
+                  "rarity", "encounter_rate", "nmy_icon"), bestiary_row),
+    "perks": (perks_path, "perks_data", ("id", "perk_name", "bonus"), perk_row),
+}
+
+def read_file(path):
+    with open(path, "rb") as file:
+        return file.read()
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+@timed()
+async def get_meta(key):
+    row = await pool.fetchone("SELECT value FROM meta WHERE key = ?", (key,))
+    return row[0] if row else None
+
+# Bring a table in line with its JSON file.
+# Skips everything when the file's hash matches the last seeded one; otherwise only
+# added and changed rows are written, and rows that were removed from the file are
+# deleted (rows added by hand, such as perks from !admin perk, are left alone).
+# Returns (added, changed, removed), or None when the file is unchanged.
+@timed()
+async def seed_dataset(name, force=False):
+    path, table, columns, build_row = DATASETS[name]
     try:
-        # Ensure the JSON file exists
-        if not os.path.exists(export_path):
-            print(f"Import file not found: {export_path}")
-            return
-        
-        # Read the JSON file
-        with open(export_path, "r", encoding="utf-8") as json_file:
-            user_data = json.load(json_file)
-        
-        # Connect to the database
-        with sqlite3.connect(db_path) as conn:
-            cursor = conn.cursor()
-            
-            for user_id, data in user_data.items():
-                crowns = data.get("crowns", 0)
-                inventory = json.dumps(data.get("inventory", []))
-                characters = json.dumps(data.get("characters", []))
-                
-                # Check if the user_id already exists
-                cursor.execute("SELECT user_id FROM user_data WHERE user_id = ?", (user_id,))
-                result = cursor.fetchone()
-                
-                if result:
-                    # Update existing user data
-                    cursor.execute(
-                        """
-                        UPDATE user_data
-                        SET crowns = ?, inventory = ?, characters = ?
-                        WHERE user_id = ?
-                        """,
-                        (crowns, inventory, characters, user_id),
-                    )
-                else:
-                    # Insert new user data
-                    cursor.execute(
-                        """
-                        INSERT INTO user_data (user_id, crowns, inventory, characters)
-                        VALUES (?, ?, ?, ?)
-                        """,
-                        (user_id, crowns, inventory, characters),
-                    )
-            
-            conn.commit()
-            print(f"User data successfully imported from {export_path}.")
-    
+        content = await asyncio.to_thread(read_file, path)
+    except (FileNotFoundError, TypeError):
+        log.error(f"The {name} JSON file could not be found.", extra={"dataset": name})
+        return None
+
+    digest = hashlib.sha256(content).hexdigest()
+    if not force and digest == await get_meta(f"hash:{name}"):
+        return None
+
+    desired = {}
+    for key, data in json.loads(content).items():
+        try:
+            row = build_row(key, data)
+            desired[row[0]] = row
+        except (KeyError, TypeError, ValueError) as e:
+            log.warning(f"Error occurred while reading {key} from the {name} file: {e}", extra={"dataset": name, "key": key})
+
+    async with pool.transaction() as conn:
+        current = {row[0]: tuple(row) for row in await conn.execute_fetchall(f"SELECT {', '.join(columns)} FROM {table}")}
+        async with conn.execute("SELECT value FROM meta WHERE key = ?", (f"seeded:{name}",)) as cursor:
+            row = await cursor.fetchone()
+        seeded = set(json.loads(row[0])) if row else set()
+
+        added = [row for key, row in desired.items() if key not in current]
+        changed = [row for key, row in desired.items() if key in current and current[key] != row]
+        removed = [(key,) for key in seeded - desired.keys() if key in current]
+
+        await conn.executemany(
+            f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            added + changed,
+        )
+        await conn.executemany(f"DELETE FROM {table} WHERE {columns[0]} = ?", removed)
+        await conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", [
+            (f"hash:{name}", digest),
+            (f"seeded:{name}", json.dumps(list(desired))),
+        ])
+
+    log.info(
+        f"Seeded {name}: {len(added)} added, {len(changed)} changed, {len(removed)} removed.",
+        extra={"dataset": name, "added": len(added), "changed": len(changed), "removed": len(removed)},
+    )
+
+    # Keep the store's in-memory copy in step once it is in use
+    if name == "armory" and armory.ready:
+        await load_armory_index()
+    # Likewise for the encounter tables
+    if name == "bestiary" and bestiary.ready:
+        await load_bestiary_index()
+    return len(added), len(changed), len(removed)
+
+async def import_armory_items():
+    return await seed_dataset("armory")
+
+async def import_bestiary():
+    return await seed_dataset("bestiary")
+
+async def import_perks_info():
+    return await seed_dataset("perks")
+
+# Restore the user export only if it differs from the one restored last time
+async def import_user_data_if_changed():
+    path = user_export_to_import()
+    digest = await asyncio.to_thread(hash_file, path)
+    if digest == await get_meta("hash:users"):
+        return 0
+
+    count = await import_user_data(path)
+    # Only remember the file once the import got through all of it
+    if count is not None and await get_meta("import_progress") is None:
+        async with pool.transaction() as conn:
+            await conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('hash:users', ?)", (digest,))
+    return count
+
+# The export restored on startup, preferring the streaming export over the legacy JSON one
+def user_export_to_import():
+    for path in (full_export_path, export_path):
+        if path and os.path.exists(path):
+            return path
+    return None
+
+# Read an export one user at a time as (user_id, crowns, characters JSON, inventory list).
+# NDJSON exports (optionally gzipped) are streamed line by line; the legacy JSON export
+# is a single object, so it still has to be parsed whole.
+def read_user_export(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as export_file:
+        if ".ndjson" in os.path.basename(path):
+            for line in export_file:
+                if line.strip():
+                    data = json.loads(line)
+                    yield data["user_id"], data
+        else:
+            yield from json.load(export_file).items()
+
+def user_export_rows(path):
+    for user_id, data in read_user_export(path):
+        yield (
+            str(user_id),
+            int(data.get("crowns", 0)),
+            json.dumps(data.get("characters", [])),
+            [(item["item_name"], item["quantity"]) for item in data.get("inventory", []) if item["quantity"] > 0],
+        )
+
+# Restore users from an export in chunked transactions.
+# Progress is saved with every chunk, so an interrupted import of the same file
+# picks up after the last committed chunk. Returns the number of users imported,
+# or None if the import failed.
+@timed()
+async def import_user_data(path=None, chunk_size=1000):
+    path = path or user_export_to_import()
+    try:
+        # Ensure the export file exists
+        if not path or not os.path.exists(path):
+            log.error(f"Import file not found: {path or export_path}")
+            return None
+
+        stat = os.stat(path)
+        file_id = json.dumps([os.path.abspath(path), stat.st_size, stat.st_mtime_ns])
+        row = await pool.fetchone("SELECT value FROM meta WHERE key = 'import_progress'")
+        progress = json.loads(row[0]) if row else {}
+        done = progress.get("records", 0) if progress.get("file") == file_id else 0
+        if done:
+            log.info(f"Resuming import of {path} after {done} users.", extra={"path": path, "users": done})
+
+        rows = user_export_rows(path)
+        # Parsing happens in a worker thread, one chunk at a time
+        await asyncio.to_thread(lambda: sum(1 for _ in itertools.islice(rows, done)))
+
+        chunks = 0
+        while True:
+            chunk = await asyncio.to_thread(lambda: list(itertools.islice(rows, chunk_size)))
+            if not chunk:
+                break
+
+            user_ids = [(user_id,) for user_id, _, _, _ in chunk]
+            async with pool.transaction() as conn:
+                await conn.executemany("""
+                INSERT INTO user_data (user_id, crowns, characters)
+                VALUES (?, ?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET crowns = excluded.crowns, characters = excluded.characters
+                """, [(user_id, crowns, characters) for user_id, crowns, characters, _ in chunk])
+
+                # Replace the users' inventories with the exported ones
+                await conn.executemany("DELETE FROM inventory WHERE user_id = ?", user_ids)
+                await conn.executemany(UPSERT_INVENTORY, [
+                    (user_id, item_name, quantity)
+                    for user_id, _, _, inventory in chunk
+                    for item_name, quantity in inventory
+                ])
+
+                done += len(chunk)
+                await conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('import_progress', ?)",
+                    (json.dumps({"file": file_id, "records": done}),),
+                )
+            for user_id, crowns, _, _ in chunk:
+                leaderboard.set(user_id, crowns + crown_buffer.pending_for(user_id))
+            chunks += 1
+            if chunks % import_progress_every == 0:
+                log.info(f"Imported {done} users from {path}...", extra={"path": path, "users": done})
+
+        async with pool.transaction() as conn:
+            await conn.execute("DELETE FROM meta WHERE key = 'import_progress'")
+        log.info(f"User data successfully imported from {path} ({done} users).", extra={"path": path, "users": done})
+        return done
+
     except sqlite3.Error as e:
-        print(f"Database error: {e}")
-    except json.JSONDecodeError as e:
-        print(f"JSON decode error: {e}")
+        log.exception(f"Database error: {e}")
+    except (json.JSONDecodeError, KeyError, TypeError, ValueError) as e:
+        log.error(f"Invalid user export: {e}")
     except Exception as e:
-        print(f"An error occurred: {e}")
+        log.exception(f"An error occurred: {e}")
+    return None
 
 # Add a new user to the database
-def add_user(user_id):
-    with sqlite3.connect(db_path) as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
+@timed()
+async def add_user(user_id):
+    async with pool.transaction() as conn:
+        await conn.execute("""
         INSERT OR IGNORE INTO user_data (user_id, crowns, inventory)
         VALUES (?, ?, ?)
         """, (user_id, 0, "[]"))
-        conn.commit()
+    leaderboard.add(user_id, 0)
+
+# Members of the given roles plus the mentioned members, once each and without bots
+def expand_targets(targets):
+    members = {}
+    for target in targets:
+        for member in target.members if isinstance(target, discord.Role) else [target]:
+            if not member.bot:
+                members[member.id] = member
+    return list(members.values())
 
 # embed builder function
 def embed_builder(title, description, color=discord.Color.dark_gold(), fields=None, thumbnail_url=None, image_url=None, footer_text=None):
@@ -250,119 +470,197 @@ def embed_builder(title, description, color=discord.Color.dark_gold(), fields=No
         embed.set_footer(text="Use !help to learn more about commands.")
     return embed
 
-def export_users_to_json():
+# Export users to a gzipped NDJSON file, one user per line, without blocking the event loop.
+# The incremental export only contains users changed since the previous export.
+# Returns (path, number of users written).
+@timed()
+async def export_user_data(incremental=False):
+    row = await pool.fetchone("SELECT value FROM meta WHERE key = 'export_watermark'")
+    since = int(row[0]) if incremental and row else 0
+    path = incremental_export_path if incremental else full_export_path
+
+    # Buffered message Crowns belong in the backup too
+    await crown_buffer.flush()
+
+    # Taken under the write lock, so every write stamped before the watermark has committed
+    # and is in the export's snapshot. Users changed while the export runs are picked up by the next one.
+    async with pool.transaction() as conn:
+        async with conn.execute(f"SELECT {NOW_MS}") as cursor:
+            watermark = (await cursor.fetchone())[0]
+    count = await asyncio.to_thread(write_user_export, path, since)
+
+    async with pool.transaction() as conn:
+        await conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('export_watermark', ?)", (str(watermark),)
+        )
+    log.info(f"Exported {count} users to {path}.", extra={"path": path, "users": count, "incremental": incremental})
+    return path, count
+
+# Stream user_data and inventory rows into the export file, runs in a worker thread
+def write_user_export(path, since=0):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temp_path = path + ".tmp"
+    count = 0
+
+    # A separate read-only connection, WAL lets it read while the bot keeps writing
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
     try:
-        # Connect to the database
-        with sqlite3.connect(db_path) as conn:
-            cursor = conn.cursor()
-            
-            # Query to fetch all data from user_data table
-            cursor.execute("SELECT user_id, crowns, inventory, characters FROM user_data")
-            rows = cursor.fetchall()
-            
-            # Transform data into a dictionary
-            user_data = {}
-            for row in rows:
-                user_id = row[0]
-                crowns = row[1]
-                inventory = json.loads(row[2]) if row[2] else []  # Convert JSON string to Python list
-                characters = json.loads(row[3]) if row[3] else []  # Convert JSON string to Python list
-                
-                user_data[user_id] = {
-                    "crowns": crowns,
-                    "inventory": inventory,
-                    "characters": characters,
-                }
-            
-            # Ensure the export folder exists
-            os.makedirs(os.path.dirname(export_path), exist_ok=True)
-            
-            # Write the dictionary to a JSON file
-            with open(export_path, "w", encoding="utf-8") as json_file:
-                json.dump(user_data, json_file, indent=4, ensure_ascii=False)
-            
-            print(f"User data successfully exported to {export_path}.")
-    
-    except sqlite3.Error as e:
-        print(f"Database error: {e}")
-    except Exception as e:
-        print(f"An error occurred: {e}")
+        rows = conn.execute("""
+        SELECT u.user_id, u.crowns, u.characters, i.item_name, i.quantity
+        FROM user_data u
+        LEFT JOIN inventory i ON i.user_id = u.user_id
+        WHERE u.updated_at >= ?
+        ORDER BY u.user_id, i.item_name
+        """, (since,))
+
+        with gzip.open(temp_path, "wt", encoding="utf-8") as export_file:
+            for (user_id, crowns, characters), items in itertools.groupby(rows, key=lambda row: row[:3]):
+                inventory = [
+                    {"item_name": item_name, "quantity": quantity}
+                    for _, _, _, item_name, quantity in items if item_name is not None
+                ]
+                # characters is already stored as JSON, so it is written as-is
+                export_file.write(
+                    f'{{"user_id": {json.dumps(user_id)}, "crowns": {crowns or 0}, '
+                    f'"inventory": {json.dumps(inventory, ensure_ascii=False)}, "characters": {characters or "[]"}}}\n'
+                )
+                count += 1
+    finally:
+        conn.close()
+
+    os.replace(temp_path, path)
+    return count
 
 # Retrieve leaderboard
-def get_leaderboard():
-    with sqlite3.connect(db_path) as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
+@timed()
+async def get_leaderboard():
+    # Served from memory once the leaderboard has been loaded
+    if leaderboard.ready:
+        return leaderboard.get_top(10)
+
+    # Unflushed message Crowns are counted as well
+    pending = crown_buffer.snapshot()
+    async with pool.reader() as conn:
+        balances = dict(await conn.execute_fetchall("""
         SELECT user_id, crowns
         FROM user_data
         ORDER BY crowns DESC
         LIMIT 10
-        """)
-        return cursor.fetchall()
+        """))
+
+        # Users with pending Crowns can climb into the top 10, so their stored balance is needed too
+        missing = [user_id for user_id in pending if user_id not in balances]
+        for i in range(0, len(missing), 500):
+            chunk = missing[i:i + 500]
+            balances.update(await conn.execute_fetchall(
+                f"SELECT user_id, crowns FROM user_data WHERE user_id IN ({','.join('?' * len(chunk))})",
+                chunk,
+            ))
+
+    for user_id, amount in pending.items():
+        balances[user_id] = balances.get(user_id, 0) + amount
+
+    return sorted(balances.items(), key=lambda row: row[1], reverse=True)[:10]
+
+# Load every balance into the in-memory leaderboard, done once at startup
+@timed()
+async def load_leaderboard():
+    rows = await pool.fetchall("SELECT user_id, crowns FROM user_data")
+    leaderboard.load(rows)
+    for user_id, amount in crown_buffer.snapshot().items():
+        leaderboard.add(user_id, amount)
 
 # Retrieve user data
-def get_user_data(user_id):
-    with sqlite3.connect(db_path) as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT crowns, inventory, characters FROM user_data WHERE user_id = ?", (user_id,))
-        return cursor.fetchone()
+# Returns (crowns, inventory, characters) where inventory is a list of (item_name, quantity)
+@timed()
+async def get_user_data(user_id):
+    async with pool.reader() as conn:
+        async with conn.execute("SELECT crowns, characters FROM user_data WHERE user_id = ?", (str(user_id),)) as cursor:
+            result = await cursor.fetchone()
+        inventory = await conn.execute_fetchall(INVENTORY_QUERY, (str(user_id),)) if result else []
+
+    # Include message Crowns that are still waiting in the accrual buffer
+    pending = crown_buffer.pending_for(user_id)
+    if result is None:
+        return (pending, [], "[]") if crown_buffer.is_pending(user_id) else None
+    crowns, characters = result
+    return crowns + pending, list(inventory), characters
 
 # give_crowns
-def give_crowns(giver, amount, recipient):
-    with sqlite3.connect(db_path) as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT crowns FROM user_data WHERE user_id = ?", (str(giver),))
-        giver_crowns = cursor.fetchone()
-        
-        if not giver_crowns or giver_crowns[0] < amount:
-            return False 
-
-        cursor.execute("UPDATE user_data SET crowns = crowns - ? WHERE user_id = ?", (amount, str(giver)))
-
-        # Get the recipient's balance
-        cursor.execute("SELECT crowns FROM user_data WHERE user_id = ?", (str(recipient),))
-        recipient_balance = cursor.fetchone()
-        if not recipient_balance:
-            # If the recipient doesn't exist in the database, add them
-            cursor.execute("INSERT INTO user_data (user_id, crowns, inventory) VALUES (?, ?, ?)", 
-                           (str(recipient), amount, json.dumps([])))
-        else:
-            # Add crowns to the recipient
-            cursor.execute("UPDATE user_data SET crowns = crowns + ? WHERE user_id = ?", (amount, str(recipient)))
-        conn.commit()
-        return True
+@timed()
+async def give_crowns(giver, amount, recipient):
+    return await give_crowns_batch(giver, amount, [recipient]) is not None
+
+# Give the same amount to every recipient in one transaction.
+# Returns the giver's remaining balance, or None if they can't cover all of it.
+@timed()
+async def give_crowns_batch(giver, amount, recipients):
+    giver = str(giver)
+    recipients = [str(recipient) for recipient in recipients]
+    pending = 0
+    try:
+        async with pool.transaction() as conn:
+            # Message Crowns that haven't been flushed yet can be given away too
+            pending = await crown_buffer.apply_pending(conn, giver)
+
+            # Take the whole amount from the giver only if they can afford it
+            total = amount * len(recipients)
+            async with conn.execute(
+                "UPDATE user_data SET crowns = crowns - ? WHERE user_id = ? AND crowns >= ? RETURNING crowns",
+                (total, giver, total),
+            ) as cursor:
+                result = await cursor.fetchone()
+
+            if result is None:
+                return None
+
+            # Credit the recipients, creating the ones who aren't in the database yet
+            await conn.executemany(UPSERT_CROWNS, [(recipient, amount) for recipient in recipients])
+    except BaseException:
+        crown_buffer.restore(giver, pending)
+        raise
+
+    leaderboard.add(giver, -total)
+    for recipient in recipients:
+        leaderboard.add(recipient, amount)
+    return result[0]
+
+# Split a pot of Crowns evenly between the recipients, nobody is charged for it.
+# Returns each recipient's share; the remainder of the division is not paid out.
+@timed()
+async def split_crowns(total, recipients):
+    recipients = [str(recipient) for recipient in recipients]
+    if not recipients:
+        return 0
+    share = total // len(recipients)
+    if share > 0:
+        async with pool.transaction() as conn:
+            await conn.executemany(UPSERT_CROWNS, [(recipient, share) for recipient in recipients])
+        for recipient in recipients:
+            leaderboard.add(recipient, share)
+    return share
+
+# Credit many users at once from {user_id: amount}, in one transaction.
+# Users who aren't in the database yet are created. Returns the number of users credited.
+@timed()
+async def credit_crowns(amounts):
+    amounts = {str(user_id): amount for user_id, amount in amounts.items() if amount}
+    if not amounts:
+        return 0
+    async with pool.transaction() as conn:
+        await conn.executemany(UPSERT_CROWNS, amounts.items())
+    leaderboard.add_many(amounts)
+    return len(amounts)
 
 # Admin Role Check
-def is_admin():
-    async def predicate(ctx):
-        if ctx.author.guild_permissions.administrator:
-            return True  # Allow server administrators
-        user_roles = [role.id for role in ctx.author.roles]
-        return any(role_id in admin_roles for role_id in user_roles)
-    return commands.check(predicate)
-
-#Import Store Items
-def load_armory_json():
-
-    armory_link = os.path.join(armory_path)
-      
-    with open(armory_link, 'r') as file:
-        return json.load(file)
-    
-#Import Enemies From Bestiary
-def load_bestiary_json():
+async def is_admin_member(ctx):
+    if ctx.author.guild_permissions.administrator:
+        return True  # Allow server administrators
+    user_roles = [role.id for role in ctx.author.roles]
+    return any(role_id in admin_roles for role_id in user_roles)
 
-    bestiary_link = os.path.join(bestiary_path)
-      
-    with open(bestiary_link, 'r') as file:
-        return json.load(file)
-
-#Import Perk Info
-def load_perks_info():
-    perks_link = os.path.join(perks_path)
-      
-    with open(perks_link, 'r') as file:
-        return json.load(file)
+def is_admin():
+    return commands.check(is_admin_member)
 
 #Import previous data about users  
 def load_user_data():
@@ -372,50 +670,42 @@ def load_user_data():
         return json.load(file)
 
 # Function To Add or Remove Items From The Inventory
-def manage_inventory(user_id, item_name, quantity):
-    
-    with sqlite3.connect(db_path) as conn:
-        cursor = conn.cursor()
-        
-        # Get the user's current inventory
-        cursor.execute("SELECT inventory FROM user_data WHERE user_id = ?", (str(user_id),))
-        result = cursor.fetchone()
-        if result:
-            inventory = json.loads(result[0])  # Parse the JSON string into a Python list
-        else:
-            inventory = []
-        
-        # Check if the item already exists in the inventory
-        for item in inventory:
-            if item["item_name"] == item_name:
-                item["quantity"] += quantity
-                # Remove the item if quantity drops to 0 or below
-                if item["quantity"] <= 0:
-                    inventory.remove(item)
-                break
-        else:
-            # Add new item to the inventory if quantity is positive
-            if quantity > 0:
-                inventory.append({"item_name": item_name, "quantity": quantity})
-        
-        # Save the updated inventory back to the database
-        cursor.execute("UPDATE user_data SET inventory = ? WHERE user_id = ?", (json.dumps(inventory), str(user_id)))
-        conn.commit()
+# Returns the quantity the user holds afterwards
+@timed()
+async def manage_inventory(user_id, item_name, quantity):
+    async with pool.transaction() as conn:
+        return await change_inventory(conn, user_id, item_name, quantity)
+
+# Inventory update for use inside an open transaction
+@timed()
+async def change_inventory(conn, user_id, item_name, quantity):
+    user_id = str(user_id)
+    if quantity > 0:
+        # Make sure the owner has a profile
+        await conn.execute("INSERT OR IGNORE INTO user_data (user_id) VALUES (?)", (user_id,))
+
+    async with conn.execute(UPSERT_INVENTORY + " RETURNING quantity", (user_id, item_name, quantity)) as cursor:
+        new_quantity = (await cursor.fetchone())[0]
+
+    # Remove the item if quantity drops to 0 or below
+    if new_quantity <= 0:
+        await conn.execute("DELETE FROM inventory WHERE user_id = ? AND item_name = ?", (user_id, item_name))
+        return 0
+    return new_quantity
 
 # Let users manage the characters tied to their account
-def manage_user_characters(user_id, character_name, character_title, character_sheet_url, action):
-    with sqlite3.connect(db_path) as conn:
-        cursor = conn.cursor()
-        
+@timed()
+async def manage_user_characters(user_id, character_name, character_title, character_sheet_url, action):
+    async with pool.transaction() as conn:
         # Fetch the current characters
-        cursor.execute("SELECT characters FROM user_data WHERE user_id = ?", (user_id,))
-        result = cursor.fetchone()
+        async with conn.execute("SELECT characters FROM user_data WHERE user_id = ?", (user_id,)) as cursor:
+            result = await cursor.fetchone()
         
         if result:
             characters = json.loads(result[0])
         else:
             # If the user doesn't exist in the table, create an entry
-            cursor.execute("INSERT INTO user_data (user_id) VALUES (?)", (user_id,))
+            await conn.execute("INSERT INTO user_data (user_id) VALUES (?)", (user_id,))
             characters = []
         
         if action == "add":
@@ -426,42 +716,225 @@ def manage_user_characters(user_id, character_name, character_title, character_s
                 "sheet_url": character_sheet_url
             }
             characters.append(new_character)
-            print(f"Added character: {new_character}")
+            log.debug(f"Added character: {new_character}", extra={"user_id": user_id})
         elif action == "remove":
             # Remove the character by name
             characters = [char for char in characters if char["name"] != character_name]
-            print(f"Removed character with name: {character_name}")
+            log.debug(f"Removed character with name: {character_name}", extra={"user_id": user_id})
         else:
             raise ValueError("Invalid action. Use 'add' or 'remove'.")
         
         # Update the characters in the database
-        cursor.execute("UPDATE user_data SET characters = ? WHERE user_id = ?", (json.dumps(characters), user_id))
-        conn.commit()
+        await conn.execute("UPDATE user_data SET characters = ? WHERE user_id = ?", (json.dumps(characters), user_id))
 
 # Update crowns for a user
+@timed()
 async def update_crowns(user_id, amount, name):
-    async with aiosqlite.connect(db_path) as conn:
-        cursor = await conn.cursor()
-        
+    async with pool.transaction() as conn:
         # Check if the user exists
-        await cursor.execute("SELECT 1 FROM user_data WHERE user_id = ?", (user_id,))
-        result = await cursor.fetchone()
+        async with conn.execute("SELECT 1 FROM user_data WHERE user_id = ?", (str(user_id),)) as cursor:
+            result = await cursor.fetchone()
 
         if result is None:
             # User doesn't exist, add them to the database
-            print(f"Adding new user {name.display_name} to the database.")
-            await cursor.execute("""
+            log.debug(f"Adding new user {name.display_name} to the database.", extra={"user_id": str(user_id)})
+            await conn.execute("""
             INSERT INTO user_data (user_id, crowns, inventory)
             VALUES (?, ?, ?)
-            """, (user_id, 0, "[]"))
+            """, (str(user_id), 0, "[]"))
 
         # Update the crowns for the user
-        print(f"Updating Crowns for user {name.display_name}. Adding {amount} Crowns.")
-        await cursor.execute("""
+        log.debug(f"Updating Crowns for user {name.display_name}. Adding {amount} Crowns.", extra={"user_id": str(user_id), "crowns": amount})
+        await conn.execute("""
         UPDATE user_data
         SET crowns = crowns + ?
         WHERE user_id = ?
-        """, (amount, user_id))
+        """, (amount, str(user_id)))
+    leaderboard.add(user_id, amount)
+    return result
+
+# Adjust a user's balance by a signed amount, refusing to go below zero.
+# Returns the new balance, False if the balance is too low, or None if the user has no profile.
+@timed()
+async def adjust_crowns(user_id, amount):
+    pending = 0
+    try:
+        async with pool.transaction() as conn:
+            # Message Crowns that haven't been flushed yet are part of the balance
+            pending = await crown_buffer.apply_pending(conn, user_id)
+            async with conn.execute("SELECT crowns FROM user_data WHERE user_id = ?", (str(user_id),)) as cursor:
+                result = await cursor.fetchone()
+
+            if result is None:
+                return None
+            if result[0] + amount < 0:
+                return False
+
+            await conn.execute("UPDATE user_data SET crowns = crowns + ? WHERE user_id = ?", (amount, str(user_id)))
+    except BaseException:
+        crown_buffer.restore(user_id, pending)
+        raise
+
+    leaderboard.add(user_id, amount)
+    return result[0] + amount
+
+# Apply many Crown and item adjustments in one transaction, for bulk admin rewards.
+# Operations are (user_id, crowns, item_name, quantity); item_name may be None.
+# Credits can't fail and are written in batches. Each debit is checked on its own and
+# left out entirely if the user has no profile or can't cover it.
+# Returns {"applied": [user_id], "skipped": [(user_id, reason)], "insufficient": [user_id]}.
+@timed()
+async def bulk_adjust(operations):
+    applied, skipped, insufficient = [], [], []
+    credits, debits = [], []
+    for user_id, crowns, item_name, quantity in operations:
+        operation = (str(user_id), crowns, item_name if quantity else None, quantity)
+        (debits if crowns < 0 or (operation[2] and quantity < 0) else credits).append(operation)
+
+    taken = {}
+    try:
+        async with pool.transaction() as conn:
+            for user_id, crowns, item_name, quantity in debits:
+                # Message Crowns that haven't been flushed yet can be spent too
+                taken[user_id] = taken.get(user_id, 0) + await crown_buffer.apply_pending(conn, user_id)
+                async with conn.execute("SELECT crowns FROM user_data WHERE user_id = ?", (user_id,)) as cursor:
+                    row = await cursor.fetchone()
+                if row is None:
+                    skipped.append((user_id, "no profile"))
+                    continue
+
+                enough = row[0] + crowns >= 0
+                if enough and item_name and quantity < 0:
+                    async with conn.execute(
+                        "SELECT quantity FROM inventory WHERE user_id = ? AND item_name = ?", (user_id, item_name)
+                    ) as cursor:
+                        held = await cursor.fetchone()
+                    enough = held is not None and held[0] >= -quantity
+                if not enough:
+                    insufficient.append(user_id)
+                    continue
+
+                if crowns:
+                    await conn.execute("UPDATE user_data SET crowns = crowns + ? WHERE user_id = ?", (crowns, user_id))
+                if item_name:
+                    await change_inventory(conn, user_id, item_name, quantity)
+                applied.append((user_id, crowns))
+
+            # Credits create the users who aren't in the database yet
+            await conn.executemany(UPSERT_CROWNS, [(user_id, crowns) for user_id, crowns, _, _ in credits])
+            await conn.executemany(UPSERT_INVENTORY, [
+                (user_id, item_name, quantity) for user_id, _, item_name, quantity in credits if item_name
+            ])
+            applied.extend((user_id, crowns) for user_id, crowns, _, _ in credits)
+    except BaseException:
+        for user_id, amount in taken.items():
+            crown_buffer.restore(user_id, amount)
+        raise
+
+    deltas = {}
+    for user_id, crowns in applied:
+        deltas[user_id] = deltas.get(user_id, 0) + crowns
+    leaderboard.add_many(deltas)
+    return {"applied": [user_id for user_id, _ in applied], "skipped": skipped, "insufficient": insufficient}
+
+# Hand out items to many users in one transaction, from {user_id: {item_name: quantity}}.
+# Users who aren't in the database yet are created. Returns the number of items granted.
+@timed()
+async def grant_items(grants):
+    rows = [
+        (str(user_id), item_name, quantity)
+        for user_id, items in grants.items()
+        for item_name, quantity in items.items()
+        if quantity > 0
+    ]
+    if not rows:
+        return 0
+    async with pool.transaction() as conn:
+        await conn.executemany(
+            "INSERT OR IGNORE INTO user_data (user_id) VALUES (?)", [(user_id,) for user_id in {row[0] for row in rows}]
+        )
+        await conn.executemany(UPSERT_INVENTORY, rows)
+    for user_id in {row[0] for row in rows}:
+        leaderboard.add(user_id, 0)
+    return sum(quantity for _, _, quantity in rows)
+
+# Buy an item: charge the user and put the item in their inventory, in one transaction.
+# Returns the remaining balance, or None if the user can't afford it.
+@timed()
+async def buy_item(user_id, item_name, price):
+    user_id = str(user_id)
+    pending = 0
+    try:
+        async with pool.transaction() as conn:
+            # Message Crowns that haven't been flushed yet count towards the price
+            pending = await crown_buffer.apply_pending(conn, user_id)
+
+            # Deduct the Crowns only if the balance covers the price
+            async with conn.execute(
+                "UPDATE user_data SET crowns = crowns - ? WHERE user_id = ? AND crowns >= ? RETURNING crowns",
+                (price, user_id, price),
+            ) as cursor:
+                result = await cursor.fetchone()
+
+            if result is None:
+                return None
+
+            # Add the item to the inventory
+            await change_inventory(conn, user_id, item_name, 1)
+    except BaseException:
+        crown_buffer.restore(user_id, pending)
+        raise
+
+    leaderboard.add(user_id, -price)
+    return result[0]
+
+# Load armory_data into the in-memory index used by the store
+@timed()
+async def load_armory_index():
+    armory.load(await pool.fetchall(
+        "SELECT item_name, price, item_description, category_tag, species_tag FROM armory_data"
+    ))
+
+# Load the bestiary into the in-memory index used for encounters
+@timed()
+async def load_bestiary_index():
+    bestiary.load(await pool.fetchall(
+        "SELECT nmy_name, nmy_description, drop_pool, element, special, hp, attack, speed, rarity, encounter_rate, nmy_icon FROM bestiary"
+    ))
+
+# Store categories, without the debug items
+@timed()
+async def get_store_categories():
+    if armory.ready:
+        return list(armory.categories)
+    rows = await pool.fetchall("SELECT DISTINCT category_tag FROM armory_data WHERE category_tag != ?", ("Debug Item",))
+    return [row[0] for row in rows]
+
+# Every item in the armory, in alphabetical order
+@timed()
+async def get_catalogue_items():
+    if armory.ready:
+        return list(armory.catalogue)
+    return await pool.fetchall(
+        "SELECT item_name, price, item_description, category_tag, species_tag FROM armory_data ORDER BY item_name"
+    )
 
-        await conn.commit()
-    return result
\ No newline at end of file
+# Retrieve all perks
+@timed()
+async def get_perks():
+    return await pool.fetchall("SELECT id, perk_name, bonus FROM perks_data")
+
+# Add a perk, keeping the existing one if the role is already a perk
+@timed()
+async def add_perk(role_id, perk_name, bonus):
+    async with pool.transaction() as conn:
+        await conn.execute(
+            "INSERT OR IGNORE INTO perks_data (id, perk_name, bonus) VALUES (?, ?, ?)",
+            (role_id, perk_name, bonus),
+        )
+
+# Remove a perk
+@timed()
+async def remove_perk(role_id):
+    async with pool.transaction() as conn:
+        await conn.execute("DELETE FROM perks_data WHERE id = ?", (role_id,))
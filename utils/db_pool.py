@@ -0,0 +1,109 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+import aiosqlite
+from dotenv import load_dotenv
+
+# Load .env file to get variables
+load_dotenv()
+db_path = os.getenv("db_path")
+# Number of read connections kept open next to the single writer
+pool_size = int(os.getenv("db_pool_size", "4"))
+# Page cache per connection, negative values are KiB (default 16 MiB)
+cache_size = int(os.getenv("db_cache_size", "-16000"))
+# Bytes of the database file to memory-map (default 128 MiB)
+mmap_size = int(os.getenv("db_mmap_size", str(128 * 1024 * 1024)))
+# Number of prepared statements each connection keeps compiled
+statement_cache = int(os.getenv("db_statement_cache", "256"))
+
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    f"PRAGMA cache_size = {cache_size}",
+    f"PRAGMA mmap_size = {mmap_size}",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA busy_timeout = 5000",
+)
+
+class ConnectionPool:
+    # Long-lived aiosqlite connections shared by the whole bot.
+    # Reads are spread over `size` reader connections, all writes go through one
+    # writer connection so transactions never fight over the WAL write lock.
+    def __init__(self, path, size=pool_size):
+        self.path = path
+        self.size = size
+        self._readers = None
+        self._writer = None
+        self._connections = []
+        self._open_lock = None
+        self._write_lock = None
+
+    async def _connect(self):
+        # isolation_level=None leaves transaction control to transaction() below
+        conn = await aiosqlite.connect(self.path, isolation_level=None, cached_statements=statement_cache)
+        for pragma in PRAGMAS:
+            await conn.execute(pragma)
+        self._connections.append(conn)
+        return conn
+
+    async def open(self):
+        # Connections are opened on first use so they belong to the bot's event loop
+        if self._writer is not None:
+            return
+        if self._open_lock is None:
+            self._open_lock = asyncio.Lock()
+
+        async with self._open_lock:
+            if self._writer is not None:
+                return
+            # Open the writer first so WAL mode is set before the readers attach
+            writer = await self._connect()
+            self._readers = asyncio.Queue()
+            for _ in range(self.size):
+                self._readers.put_nowait(await self._connect())
+            self._write_lock = asyncio.Lock()
+            self._writer = writer
+
+    async def close(self):
+        for conn in self._connections:
+            await conn.close()
+        self._connections = []
+        self._readers = None
+        self._writer = None
+        self._write_lock = None
+
+    @asynccontextmanager
+    async def reader(self):
+        await self.open()
+        conn = await self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put_nowait(conn)
+
+    @asynccontextmanager
+    async def transaction(self):
+        # Everything done on the yielded connection commits together or not at all
+        await self.open()
+        async with self._write_lock:
+            try:
+                # Inside the try, so a BEGIN that fails or is cancelled can't leave the writer mid-transaction
+                await self._writer.execute("BEGIN IMMEDIATE")
+                yield self._writer
+            except BaseException:
+                await self._writer.rollback()
+                raise
+            else:
+                await self._writer.commit()
+
+    async def fetchone(self, sql, params=()):
+        async with self.reader() as conn:
+            async with conn.execute(sql, params) as cursor:
+                return await cursor.fetchone()
+
+    async def fetchall(self, sql, params=()):
+        async with self.reader() as conn:
+            return await conn.execute_fetchall(sql, params)
+
+# Shared pool for the bot's database
+pool = ConnectionPool(db_path)
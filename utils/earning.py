@@ -0,0 +1,89 @@
+import os
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+# Load .env file to get variables
+load_dotenv()
+# Length (in seconds) of the earning window
+earn_window = float(os.getenv("earn_window", "60"))
+# Most Crowns a user can earn per window once their burst is used up
+earn_max_per_window = float(os.getenv("earn_max_per_window", "50"))
+# Most Crowns a user can earn at once after being quiet for a while
+earn_burst = float(os.getenv("earn_burst", "50"))
+# Seconds after an earning message during which further messages earn nothing
+earn_cooldown = float(os.getenv("earn_cooldown", "1"))
+# Number of users whose budget is tracked, the least recently active are forgotten first
+earn_max_tracked = int(os.getenv("earn_max_tracked", "10000"))
+
+class EarningLimiter:
+    # Token bucket per user for message Crowns, checked before anything reaches the buffer.
+    # A bucket holds up to `burst` Crowns and refills at max_per_window per window;
+    # a message earns what is left in the bucket, so spam is clamped and then dropped.
+    # A user whose bucket has refilled is forgotten, since a fresh bucket is the same.
+    def __init__(self, window=earn_window, max_per_window=earn_max_per_window, burst=earn_burst,
+                 cooldown=earn_cooldown, max_tracked=earn_max_tracked):
+        self.window = window
+        self.rate = max_per_window / window if window > 0 else float("inf")  # Crowns per second
+        self.burst = burst
+        self.cooldown = cooldown
+        self.max_tracked = max_tracked
+        self.idle_after = max(cooldown, burst / self.rate if self.rate else float("inf"))
+        self._buckets = OrderedDict()  # user_id -> [tokens, time of last refill, time last paid]
+        self.allowed = 0
+        self.clamped = 0
+        self.dropped = 0
+        self.crowns_suppressed = 0
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def allow(self, user_id, amount, now=None):
+        # How many of the `amount` Crowns a message may earn
+        now = time.monotonic() if now is None else now
+        user_id = str(user_id)
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = self._buckets[user_id] = [self.burst, now, float("-inf")]
+        else:
+            self._buckets.move_to_end(user_id)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        self._evict(now)
+
+        if amount <= 0:
+            return amount
+        cooling = now - bucket[2] < self.cooldown
+        granted = 0 if cooling else min(amount, int(bucket[0]))
+        if granted:
+            bucket[0] -= granted
+            bucket[2] = now
+
+        if granted == amount:
+            self.allowed += 1
+        elif granted:
+            self.clamped += 1
+        else:
+            self.dropped += 1
+        self.crowns_suppressed += amount - granted
+        return granted
+
+    def _evict(self, now):
+        # Buckets are kept in order of last use, so the idle ones are at the front
+        while self._buckets:
+            user_id, (_, last, _) = next(iter(self._buckets.items()))
+            if len(self._buckets) <= self.max_tracked and now - last < self.idle_after:
+                break
+            del self._buckets[user_id]
+
+    def stats(self):
+        return {
+            "allowed": self.allowed,
+            "clamped": self.clamped,
+            "dropped": self.dropped,
+            "crowns_suppressed": self.crowns_suppressed,
+            "tracked_users": len(self._buckets),
+        }
+
+# Shared limiter used by on_message
+earning_limiter = EarningLimiter()
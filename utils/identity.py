@@ -0,0 +1,87 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+# Load .env file to get variables
+load_dotenv()
+# Number of users fetched over REST that are kept around
+cache_size = int(os.getenv("identity_cache_size", "1000"))
+# How long (in seconds) a fetched user is reused before it is fetched again
+cache_ttl = float(os.getenv("identity_cache_ttl", "600"))
+
+class IdentityResolver:
+    # Turns user IDs into discord users/members without a REST call where possible:
+    # guild member cache first, then the client's user cache, then a bounded LRU of
+    # earlier fetches, and only then bot.fetch_user. Concurrent fetches of the same
+    # ID share one request.
+    def __init__(self, max_size=cache_size, ttl=cache_ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._cache = OrderedDict()  # user_id -> (user, time cached)
+        self._inflight = {}  # user_id -> future of a running fetch
+        self.member_hits = 0
+        self.cache_hits = 0
+        self.coalesced = 0
+        self.misses = 0
+
+    async def resolve(self, bot, user_id, guild=None):
+        user_id = int(user_id)
+
+        user = guild.get_member(user_id) if guild else None
+        if user is None:
+            user = bot.get_user(user_id)
+        if user is not None:
+            self.member_hits += 1
+            return user
+
+        cached = self._cache.get(user_id)
+        if cached and time.monotonic() - cached[1] < self.ttl:
+            self._cache.move_to_end(user_id)
+            self.cache_hits += 1
+            return cached[0]
+
+        if user_id in self._inflight:
+            self.coalesced += 1
+            return await asyncio.shield(self._inflight[user_id])
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[user_id] = future
+        try:
+            user = await bot.fetch_user(user_id)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved in case nobody else was waiting
+            future.exception()
+            raise
+        else:
+            future.set_result(user)
+            self._remember(user_id, user)
+            return user
+        finally:
+            del self._inflight[user_id]
+
+    def _remember(self, user_id, user):
+        self._cache[user_id] = (user, time.monotonic())
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+    def stats(self):
+        lookups = self.member_hits + self.cache_hits + self.coalesced + self.misses
+        return {
+            "member_cache_hits": self.member_hits,
+            "lru_hits": self.cache_hits,
+            "coalesced": self.coalesced,
+            "rest_fetches": self.misses,
+            "cached_users": len(self._cache),
+            "hit_rate": (lookups - self.misses) / lookups if lookups else 0.0,
+        }
+
+# Shared resolver for the cogs
+resolver = IdentityResolver()
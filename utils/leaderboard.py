@@ -0,0 +1,87 @@
+from bisect import bisect_left, insort
+
+class Leaderboard:
+    # Every user's balance (stored Crowns plus unflushed message Crowns), kept in one
+    # sorted list so the top of the leaderboard is a slice and a rank is a binary search.
+    # Entries are (-crowns, user_id): the richest user sorts first, ties by user_id.
+    def __init__(self):
+        self.balances = {}
+        self.ranked = []
+        self.ready = False
+
+    def __len__(self):
+        return len(self.ranked)
+
+    def load(self, rows):
+        # Build from (user_id, crowns) rows, done once at startup
+        self.balances = {str(user_id): crowns or 0 for user_id, crowns in rows}
+        self.ranked = sorted((-crowns, user_id) for user_id, crowns in self.balances.items())
+        self.ready = True
+
+    def add(self, user_id, amount):
+        # Record a change of `amount` Crowns
+        if not self.ready:
+            return
+        user_id = str(user_id)
+        old = self.balances.get(user_id)
+        self.balances[user_id] = (old or 0) + amount
+        self._move(user_id, old, self.balances[user_id])
+
+    def add_many(self, amounts):
+        # Record changes for many users at once, from {user_id: amount}
+        if not self.ready:
+            return
+        if len(amounts) * 8 < len(self.ranked):
+            for user_id, amount in amounts.items():
+                self.add(user_id, amount)
+            return
+        # Large batches are cheaper to apply with one re-sort than with one insort each
+        for user_id, amount in amounts.items():
+            user_id = str(user_id)
+            self.balances[user_id] = self.balances.get(user_id, 0) + amount
+        self.ranked = sorted((-crowns, user_id) for user_id, crowns in self.balances.items())
+
+    def set(self, user_id, crowns):
+        # Record an absolute balance
+        if not self.ready:
+            return
+        user_id = str(user_id)
+        old = self.balances.get(user_id)
+        self.balances[user_id] = crowns
+        self._move(user_id, old, crowns)
+
+    def _move(self, user_id, old, new):
+        if old == new and old is not None:
+            return
+        if old is not None:
+            del self.ranked[bisect_left(self.ranked, (-old, user_id))]
+        insort(self.ranked, (-new, user_id))
+
+    def get_top(self, count=10):
+        return [(user_id, -crowns) for crowns, user_id in self.ranked[:count]]
+
+    def page(self, start, count=10):
+        # `count` entries from the 0-based position `start`, as (user_id, crowns)
+        return [(user_id, -crowns) for crowns, user_id in self.ranked[start:start + count]]
+
+    def rank(self, user_id):
+        # 1-based position of the user, or None if they have no balance yet
+        user_id = str(user_id)
+        crowns = self.balances.get(user_id)
+        if crowns is None:
+            return None
+        return bisect_left(self.ranked, (-crowns, user_id)) + 1
+
+    def around(self, user_id, spread=2):
+        # The user and up to `spread` places on either side, as (rank, user_id, crowns)
+        rank = self.rank(user_id)
+        if rank is None:
+            return []
+        start = max(0, rank - 1 - spread)
+        return [
+            (start + offset + 1, neighbour, -crowns)
+            for offset, (crowns, neighbour) in enumerate(self.ranked[start:rank + spread])
+        ]
+
+# Shared leaderboard, loaded by the bot on startup
+leaderboard = Leaderboard()
@@ -0,0 +1,114 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+from dotenv import load_dotenv
+
+# Load .env file to get variables
+load_dotenv()
+# Default level for every subsystem
+log_level = os.getenv("log_level", "INFO").upper()
+# Per-subsystem levels, e.g. "database=DEBUG,accrual=WARNING"
+log_levels = os.getenv("log_levels", "")
+# "json" for one JSON object per line, "text" for plain lines
+log_format = os.getenv("log_format", "json").lower()
+# How often (in seconds) high-frequency events are summarised
+log_summary_interval = float(os.getenv("log_summary_interval", "60"))
+
+ROOT = "faded"
+
+# Attributes every LogRecord has; anything else was passed through `extra` and is logged as a field
+STANDARD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in STANDARD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry["stack"] = record.stack_info
+        return json.dumps(entry, default=str)
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record):
+        line = super().format(record)
+        fields = " ".join(f"{key}={value}" for key, value in vars(record).items() if key not in STANDARD_ATTRIBUTES)
+        return f"{line} {fields}" if fields else line
+
+_listener = None
+
+def setup_logging():
+    # Route every faded.* logger through a queue: the caller only enqueues the record,
+    # and a background thread formats it and writes it to stdout.
+    global _listener
+    if _listener is not None:
+        return
+
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter() if log_format == "json" else TextFormatter())
+    records = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(records, handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+    root = logging.getLogger(ROOT)
+    root.setLevel(log_level)
+    root.addHandler(logging.handlers.QueueHandler(records))
+    root.propagate = False
+
+    # discord.py logs through the same pipeline
+    discord_logger = logging.getLogger("discord")
+    discord_logger.setLevel(logging.INFO)
+    discord_logger.addHandler(logging.handlers.QueueHandler(records))
+    discord_logger.propagate = False
+
+    for setting in filter(None, (part.strip() for part in log_levels.split(","))):
+        subsystem, _, level = setting.partition("=")
+        logging.getLogger(f"{ROOT}.{subsystem.strip()}").setLevel(level.strip().upper())
+
+def stop_logging():
+    # Write out whatever is still queued
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+def get_logger(subsystem):
+    return logging.getLogger(f"{ROOT}.{subsystem}")
+
+class EventSummary:
+    # Counts high-frequency events and logs one line with the totals per interval,
+    # instead of a line per event.
+    def __init__(self, logger, message, interval=log_summary_interval):
+        self.logger = logger
+        self.message = message
+        self.interval = interval
+        self.totals = {}
+        self._started = time.monotonic()
+
+    def add(self, **counts):
+        for key, value in counts.items():
+            self.totals[key] = self.totals.get(key, 0) + value
+        if time.monotonic() - self._started >= self.interval:
+            self.emit()
+
+    def emit(self):
+        if self.totals and self.logger.isEnabledFor(logging.INFO):
+            self.logger.info(self.message, extra=dict(self.totals, seconds=round(time.monotonic() - self._started, 1)))
+        self.totals = {}
+        self._started = time.monotonic()
@@ -0,0 +1,102 @@
+import json
+import random
+from collections import Counter
+from utils.armory import armory
+from utils.bestiary import bestiary
+from utils.log import get_logger
+
+log = get_logger("loot")
+
+class LootTable:
+    # One enemy's drop_pool, compiled to cumulative weights so a batch of kills is a single
+    # random.choices call. Entries with no item are the chance of dropping nothing.
+    def __init__(self, entries):
+        self.items = []  # item_name or None, (min quantity, max quantity)
+        self.cumulative = []
+        total = 0.0
+        for item_name, weight, quantity in entries:
+            total += weight
+            self.items.append((item_name, quantity))
+            self.cumulative.append(total)
+
+    def roll(self, kills=1, rng=random):
+        # Items and quantities dropped by `kills` kills
+        drops = Counter()
+        if not self.items or kills <= 0:
+            return drops
+        for item_name, (low, high) in rng.choices(self.items, cum_weights=self.cumulative, k=kills):
+            if item_name is not None:
+                drops[item_name] += low if low == high else rng.randint(low, high)
+        return drops
+
+def parse_drop_pool(drop_pool):
+    # drop_pool is stored as JSON in one of these shapes:
+    #   ["Sword", "Shield"]                                   equal weights
+    #   {"Sword": 3, "Shield": 1, "nothing": 6}               item -> weight
+    #   [{"item_name": "Sword", "weight": 3, "quantity": [1, 2]}, {"item_name": null, "weight": 6}]
+    # Returns [(item_name or None, weight, (min quantity, max quantity))].
+    pool = json.loads(drop_pool) if isinstance(drop_pool, str) else drop_pool
+    if not pool:
+        return []
+    if isinstance(pool, dict):
+        pool = [{"item_name": name, "weight": weight} for name, weight in pool.items()]
+
+    entries = []
+    for entry in pool:
+        if isinstance(entry, str):
+            entry = {"item_name": entry}
+        item_name = entry.get("item_name", entry.get("item"))
+        if item_name in ("", "nothing"):
+            item_name = None
+        weight = float(entry.get("weight", 1))
+        quantity = entry.get("quantity", 1)
+        low, high = (quantity, quantity) if isinstance(quantity, int) else (int(quantity[0]), int(quantity[1]))
+        if weight < 0 or low < 1 or high < low:
+            raise ValueError(f"bad weight or quantity for {item_name}")
+        if weight > 0:
+            entries.append((item_name, weight, (low, high)))
+    return entries
+
+class LootEngine:
+    # Loot tables for the whole bestiary, compiled once from the in-memory bestiary and armory
+    # and recompiled only after either of them is reloaded.
+    def __init__(self):
+        self.tables = {}  # nmy_name -> LootTable
+        self.problems = {}  # nmy_name -> what was wrong with its drop_pool
+        self._compiled_for = None
+
+    def compile(self):
+        tables, problems = {}, {}
+        for nmy_name, enemy in bestiary.enemies.items():
+            try:
+                entries = parse_drop_pool(enemy[2])
+            except (ValueError, TypeError, KeyError, IndexError, AttributeError) as e:
+                problems[nmy_name] = f"unreadable drop_pool: {e}"
+                entries = []
+
+            # Drops have to be real store items
+            unknown = sorted({item for item, _, _ in entries if item is not None and armory.get(item) is None})
+            if unknown:
+                problems[nmy_name] = f"unknown items: {', '.join(unknown)}"
+                entries = [entry for entry in entries if entry[0] is None or armory.get(entry[0]) is not None]
+            tables[nmy_name] = LootTable(entries)
+
+        self.tables = tables
+        self.problems = problems
+        self._compiled_for = (bestiary.version, armory.version)
+        for nmy_name, problem in problems.items():
+            log.warning(f"Loot table of {nmy_name} has problems: {problem}", extra={"enemy": nmy_name})
+        return problems
+
+    def table(self, nmy_name):
+        if self._compiled_for != (bestiary.version, armory.version):
+            self.compile()
+        return self.tables.get(nmy_name)
+
+    def roll(self, nmy_name, kills=1, rng=random):
+        # Counter of the items dropped by `kills` kills of the enemy
+        table = self.table(nmy_name)
+        return table.roll(kills, rng) if table else Counter()
+
+# Shared engine, compiled on first use
+loot = LootEngine()
@@ -0,0 +1,68 @@
+import functools
+import time
+
+# Upper bounds (in seconds) of the latency histogram buckets, the last one catches everything else
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def record(self, seconds):
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        self.total += 1
+        self.sum += seconds
+
+    def cumulative(self):
+        # (upper bound, samples at or below it), the way Prometheus wants buckets
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            yield bound, seen
+
+class Metrics:
+    # Timings collected in-process, served by utils.metrics_http when it is enabled.
+    def __init__(self):
+        self.commands = {}  # command name -> Histogram
+        self.command_errors = {}  # command name -> failed invocations
+        self.db_calls = {}  # call site in utils/database.py -> Histogram
+        self._running = {}  # id(ctx) -> start time
+
+    def timed(self, site=None):
+        # Decorator recording how long a coroutine takes, labelled with its call site
+        def decorator(function):
+            name = site or function.__name__
+            histogram = self.db_calls.setdefault(name, Histogram())
+
+            @functools.wraps(function)
+            async def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await function(*args, **kwargs)
+                finally:
+                    histogram.record(time.perf_counter() - started)
+            return wrapper
+        return decorator
+
+    # Registered as the bot's before/after invoke hooks, so every command of every cog is timed
+    async def command_started(self, ctx):
+        self._running[id(ctx)] = time.perf_counter()
+
+    async def command_finished(self, ctx):
+        started = self._running.pop(id(ctx), None)
+        if started is None or ctx.command is None:
+            return
+        name = ctx.command.qualified_name
+        self.commands.setdefault(name, Histogram()).record(time.perf_counter() - started)
+        if ctx.command_failed:
+            self.command_errors[name] = self.command_errors.get(name, 0) + 1
+
+# Shared metrics for the whole process
+metrics = Metrics()
+timed = metrics.timed
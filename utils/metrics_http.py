@@ -0,0 +1,154 @@
+import math
+import os
+import time
+from aiohttp import web
+from dotenv import load_dotenv
+from utils.accrual import crown_buffer
+from utils.db_pool import pool
+from utils.earning import earning_limiter
+from utils.identity import resolver
+from utils.log import get_logger
+from utils.metrics import metrics
+from utils.watchdog import watchdog
+
+# Load .env file to get variables
+load_dotenv()
+# Port of the metrics and health endpoint, it is only started when this is set
+metrics_port = os.getenv("metrics_port")
+metrics_host = os.getenv("metrics_host", "0.0.0.0")
+# Age (in seconds) of the watchdog's last heartbeat above which /healthz reports the bot as unhealthy
+health_max_lag = float(os.getenv("health_max_lag", "5"))
+
+log = get_logger("metrics")
+
+def label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def number(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return "NaN"
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Exposition:
+    # Builds the Prometheus text format, one metric family at a time
+    def __init__(self):
+        self.lines = []
+
+    def family(self, name, kind, help_text):
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} {kind}")
+
+    def sample(self, name, value, **labels):
+        if labels:
+            pairs = ",".join(f'{key}="{label(val)}"' for key, val in labels.items())
+            self.lines.append(f"{name}{{{pairs}}} {number(value)}")
+        else:
+            self.lines.append(f"{name} {number(value)}")
+
+    def histograms(self, name, help_text, label_name, histograms):
+        self.family(name, "histogram", help_text)
+        for key, histogram in sorted(histograms.items()):
+            for bound, seen in histogram.cumulative():
+                self.sample(f"{name}_bucket", seen, **{label_name: key, "le": number(bound)})
+            self.sample(f"{name}_sum", histogram.sum, **{label_name: key})
+            self.sample(f"{name}_count", histogram.total, **{label_name: key})
+
+    def render(self):
+        return "\n".join(self.lines) + "\n"
+
+class MetricsServer:
+    # Opt-in HTTP listener serving /metrics (Prometheus text format) and /healthz
+    def __init__(self, host=metrics_host, port=metrics_port):
+        self.host = host
+        self.port = int(port) if port else None
+        self.bot = None
+        self._runner = None
+
+    async def start(self, bot):
+        if self.port is None or self._runner is not None:
+            return
+        self.bot = bot
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle_metrics)
+        app.router.add_get("/healthz", self.handle_health)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        log.info(f"Metrics listening on {self.host}:{self.port}.")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def handle_metrics(self, request):
+        return web.Response(text=self.render(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Content-Type-Options": "nosniff"})
+
+    async def handle_health(self, request):
+        # Healthy once connected to the gateway, with a working database and a responsive loop
+        checks = {"gateway": self.bot.is_ready() and not self.bot.is_closed()}
+        started = time.perf_counter()
+        try:
+            await pool.fetchone("SELECT 1")
+            checks["database"] = True
+        except Exception as e:
+            log.warning(f"Health check could not reach the database: {e}")
+            checks["database"] = False
+        checks["event_loop"] = watchdog.heartbeat_age() < health_max_lag
+        body = {
+            "status": "ok" if all(checks.values()) else "unhealthy",
+            "checks": checks,
+            "database_ms": round((time.perf_counter() - started) * 1000, 2),
+            "gateway_latency_ms": None if math.isnan(self.bot.latency) or math.isinf(self.bot.latency) else round(self.bot.latency * 1000, 1),
+        }
+        return web.json_response(body, status=200 if body["status"] == "ok" else 503)
+
+    def render(self):
+        out = Exposition()
+
+        out.histograms("faded_command_duration_seconds", "Time taken by bot commands.", "command", metrics.commands)
+        out.family("faded_command_errors_total", "Bot commands that raised an error.", "counter")
+        for name, count in sorted(metrics.command_errors.items()):
+            out.sample("faded_command_errors_total", count, command=name)
+
+        out.histograms("faded_db_call_duration_seconds", "Time taken by database calls, by call site.", "site", metrics.db_calls)
+
+        out.family("faded_messages_accrued_total", "Chat messages that earned Crowns; rate() gives messages per second.", "counter")
+        out.sample("faded_messages_accrued_total", crown_buffer.messages_accrued)
+        out.family("faded_crowns_accrued_total", "Crowns earned from chat messages.", "counter")
+        out.sample("faded_crowns_accrued_total", crown_buffer.crowns_accrued)
+        out.family("faded_crowns_pending_users", "Users with message Crowns not yet written to the database.", "gauge")
+        out.sample("faded_crowns_pending_users", len(crown_buffer.pending))
+
+        stats = earning_limiter.stats()
+        out.family("faded_earning_events_total", "Earning messages by what the token bucket let through.", "counter")
+        for outcome in ("allowed", "clamped", "dropped"):
+            out.sample("faded_earning_events_total", stats[outcome], outcome=outcome)
+        out.family("faded_earning_crowns_suppressed_total", "Crowns withheld by the token bucket.", "counter")
+        out.sample("faded_earning_crowns_suppressed_total", stats["crowns_suppressed"])
+
+        gateway_latency = self.bot.latency if self.bot else float("nan")
+        out.family("faded_gateway_latency_seconds", "Heartbeat latency to the Discord gateway.", "gauge")
+        out.sample("faded_gateway_latency_seconds", None if math.isinf(gateway_latency) else gateway_latency)
+
+        out.family("faded_event_loop_lag_seconds", "Event-loop lag measured by the watchdog.", "gauge")
+        for name, samples, p50, p99, worst in watchdog.summary()[:1]:
+            out.sample("faded_event_loop_lag_seconds", p50, quantile="0.5")
+            out.sample("faded_event_loop_lag_seconds", p99, quantile="0.99")
+            out.sample("faded_event_loop_lag_seconds", worst, quantile="1")
+        out.family("faded_event_loop_stalls_total", "Times the event loop was blocked past the watchdog threshold.", "counter")
+        out.sample("faded_event_loop_stalls_total", watchdog.stalls)
+
+        out.family("faded_cache_hit_ratio", "Share of lookups answered from a cache.", "gauge")
+        out.sample("faded_cache_hit_ratio", resolver.stats()["hit_rate"], cache="identity")
+        store_cog = self.bot.get_cog("Store") if self.bot else None
+        if store_cog:
+            out.sample("faded_cache_hit_ratio", store_cog.page_cache.stats()["hit_rate"], cache="store_pages")
+
+        return out.render()
+
+# Shared server started by the bot
+metrics_server = MetricsServer()
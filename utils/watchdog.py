@@ -0,0 +1,170 @@
+import asyncio
+import os
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+from dotenv import load_dotenv
+from utils.log import get_logger
+
+# Load .env file to get variables
+load_dotenv()
+# How often (in seconds) the loop is probed
+probe_interval = float(os.getenv("watchdog_interval", "0.1"))
+# Lag (in seconds) after which the blocking stack is captured and logged
+lag_threshold = float(os.getenv("watchdog_threshold", "0.25"))
+# Flag synchronous sqlite3 calls made from coroutines in the cogs
+strict_mode = os.getenv("watchdog_strict", "0").lower() in ("1", "true", "yes")
+
+# Upper bounds (in seconds) of the lag histogram buckets, the last one catches everything else
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, float("inf"))
+
+log = get_logger("watchdog")
+
+COGS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cogs")
+
+class LagHistogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0
+        self.worst = 0.0
+
+    def record(self, lag):
+        for i, bound in enumerate(BUCKETS):
+            if lag <= bound:
+                self.counts[i] += 1
+                break
+        self.total += 1
+        self.worst = max(self.worst, lag)
+
+    def percentile(self, fraction):
+        # Upper bound of the bucket holding the given fraction of samples
+        if not self.total:
+            return 0.0
+        wanted = fraction * self.total
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= wanted:
+                return min(bound, self.worst)
+        return self.worst
+
+class LoopWatchdog:
+    # Measures event-loop lag continuously.
+    # A probe task sleeps for `interval` and records how late it woke up. A separate
+    # thread watches the probe's heartbeat; when it stalls for longer than `threshold`
+    # it grabs the loop thread's current stack, which is whatever is hogging the loop.
+    def __init__(self, interval=probe_interval, threshold=lag_threshold, strict=strict_mode):
+        self.interval = interval
+        self.threshold = threshold
+        self.strict = strict
+        self.loop_histogram = LagHistogram()
+        self.command_histograms = {}  # command name -> LagHistogram
+        self.stalls = 0
+        self._active_commands = {}  # id(ctx) -> command name
+        self._loop = None
+        self._loop_thread_id = None
+        self._last_beat = 0.0
+        self._reported_beat = None
+        self._task = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._original_connect = None
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._task = asyncio.create_task(self._probe())
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._monitor, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+        if self.strict:
+            self._patch_sqlite()
+        log.info(f"Loop watchdog started (threshold {self.threshold * 1000:.0f} ms, strict mode {'on' if self.strict else 'off'}).")
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._stop.set()
+        if self._original_connect is not None:
+            sqlite3.connect = self._original_connect
+            self._original_connect = None
+
+    async def _probe(self):
+        while True:
+            started = self._loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, self._loop.time() - started - self.interval)
+            self._last_beat = time.monotonic()
+
+            self.loop_histogram.record(lag)
+            for name in set(self._active_commands.values()):
+                self.command_histograms.setdefault(name, LagHistogram()).record(lag)
+
+    def _monitor(self):
+        while not self._stop.wait(self.interval):
+            beat = self._last_beat
+            stalled_for = time.monotonic() - beat
+            # Report each stall once, while it is still happening
+            if stalled_for < self.threshold or beat == self._reported_beat:
+                continue
+            self._reported_beat = beat
+            self.stalls += 1
+
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else "<stack unavailable>\n"
+            task = asyncio.current_task(self._loop)
+            running = task.get_coro() if task else "a callback outside any task"
+            log.warning(
+                f"Event loop blocked for {stalled_for * 1000:.0f} ms+ while running {running}",
+                extra={"blocked_ms": round(stalled_for * 1000), "stack": stack},
+            )
+
+    # Called from the bot's before/after invoke hooks to attribute lag to whichever commands are running.
+    # The after hook runs whether the command succeeded or not, and unlike an on_command_error
+    # listener it leaves the default error handler in place.
+    def command_started(self, ctx):
+        self._active_commands[id(ctx)] = ctx.command.qualified_name
+
+    def command_finished(self, ctx):
+        self._active_commands.pop(id(ctx), None)
+
+    def _patch_sqlite(self):
+        # Wrap sqlite3.connect so calls made on the loop thread from the cogs get reported.
+        # aiosqlite connects from its own worker thread and is never flagged.
+        original = sqlite3.connect
+        watchdog = self
+
+        def connect(*args, **kwargs):
+            if threading.get_ident() == watchdog._loop_thread_id:
+                stack = traceback.extract_stack()[:-1]
+                if any(frame.filename.startswith(COGS_DIR) for frame in stack):
+                    log.warning("Blocking sqlite3.connect called from a coroutine", extra={"stack": "".join(traceback.format_list(stack))})
+            return original(*args, **kwargs)
+
+        self._original_connect = original
+        sqlite3.connect = connect
+
+    def heartbeat_age(self):
+        # Seconds since the probe last woke up, grows without bound if the probe died
+        return time.monotonic() - self._last_beat if self._task is not None else float("inf")
+
+    def summary(self):
+        # (name, samples, p50, p99, worst) for the loop and each command, worst first
+        rows = [("event loop", self.loop_histogram)] + sorted(
+            self.command_histograms.items(), key=lambda item: item[1].worst, reverse=True
+        )
+        return [
+            (name, histogram.total, histogram.percentile(0.5), histogram.percentile(0.99), histogram.worst)
+            for name, histogram in rows
+        ]
+
+# Shared watchdog started by the bot
+watchdog = LoopWatchdog()